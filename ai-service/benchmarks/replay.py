@@ -0,0 +1,530 @@
+"""
+Replay benchmark for the recognition pipeline.
+
+Feeds recorded video files or image sequences through the same code the
+service runs for its cameras (main.process_stream / handle_detections:
+capture, motion gate, detection, tracking, embedding, matching, attendance
+events, snapshot encoding) with the database, MinIO and backend replaced by
+in-memory stand-ins, and a synthetic gallery of any size.
+
+Run from ai-service/:
+    python -m benchmarks.replay --source clip.mp4 --cameras 2 --gallery 10000
+
+Pipeline settings come from the usual environment variables (INFERENCE_*,
+DET_SIZE, PROCESS_EVERY_N, MOTION_*, FACE_TRACKING, CAMERA_n_ROI...), so a
+run measures the configuration it is given. Results are written as JSON
+(see --output) and can be compared against an earlier run with --baseline.
+"""
+import argparse
+import asyncio
+import contextvars
+import glob
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from types import SimpleNamespace
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+from core.ann_index import create_index  # noqa: E402
+from core.embedding_codec import encode_embedding  # noqa: E402
+from core.gallery import EmbeddingGallery  # noqa: E402
+from core.matcher import GalleryMatcher  # noqa: E402
+from core.profiling import stage_timings  # noqa: E402
+from core.snapshot_uploader import SnapshotUploader  # noqa: E402
+from core.stream_handler import RTSPStream  # noqa: E402
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+# (camera_id, captured_at) of the frame an attendance event task came from
+_event_origin = contextvars.ContextVar('event_origin', default=None)
+
+
+class ReplaySource:
+    """
+    cv2.VideoCapture look-alike over a video file or an image directory/glob.
+    Loops at the end and, with fps > 0, paces reads like a live camera.
+    """
+
+    def __init__(self, path, fps=None):
+        self.path = path
+        if os.path.isdir(path):
+            self.images = sorted(
+                os.path.join(path, name) for name in os.listdir(path) if name.lower().endswith(IMAGE_EXTENSIONS)
+            )
+        elif any(char in path for char in '*?['):
+            self.images = sorted(glob.glob(path))
+        else:
+            self.images = None
+        self.cap = None if self.images is not None else cv2.VideoCapture(path)
+        if self.images is not None and not self.images:
+            raise ValueError(f"No images found in {path}")
+
+        native_fps = self.cap.get(cv2.CAP_PROP_FPS) if self.cap is not None else 0
+        self.fps = (native_fps or 25.0) if fps is None else fps
+        self.position = 0
+        self.next_at = time.monotonic()
+
+    def isOpened(self):
+        return self.images is not None or self.cap.isOpened()
+
+    def set(self, prop, value):
+        return True
+
+    def read(self):
+        if self.fps:
+            delay = self.next_at - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            self.next_at = max(self.next_at + 1.0 / self.fps, time.monotonic() - 1.0 / self.fps)
+
+        if self.images is not None:
+            frame = cv2.imread(self.images[self.position % len(self.images)])
+            self.position += 1
+            return frame is not None, frame
+
+        ret, frame = self.cap.read()
+        if not ret:
+            # End of file: start over
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, frame = self.cap.read()
+        return ret, frame
+
+    def release(self):
+        if self.cap is not None:
+            self.cap.release()
+
+
+def replay_stream_class(sources, fps):
+    """RTSPStream that reads the replay source mapped to its URL instead of a camera"""
+
+    class ReplayStream(RTSPStream):
+        def _open(self):
+            return ReplaySource(sources[self.rtsp_url], fps)
+
+    return ReplayStream
+
+
+class NullMinio:
+    """Accepts snapshot uploads without storing them"""
+
+    def __init__(self):
+        self.objects = 0
+        self.bytes = 0
+
+    def put_object(self, bucket, key, data, length, content_type=None):
+        self.objects += 1
+        self.bytes += length
+
+
+class MemoryOutbox:
+    """Stands in for the outbox: records events instead of delivering them"""
+
+    def __init__(self):
+        self.events = []
+
+    async def add_event(self, session_id, student_id, direction, snapshot_url=None, occurred_at=None):
+        origin = _event_origin.get()
+        self.events.append({
+            'camera_id': origin[0] if origin else None,
+            'student_id': student_id,
+            'direction': direction,
+            'latency': time.time() - origin[1] if origin else None,
+        })
+
+    def stats(self):
+        return {'pending_events': len(self.events)}
+
+
+class Recorder:
+    """Per-camera counters and latencies, reset when the warm-up ends"""
+
+    def __init__(self):
+        self.capture_times = OrderedDict()  # { id(frame): (camera_id, captured_at) }, bounded
+        self.reset()
+
+    def reset(self):
+        self.started = time.time()
+        self.processed = {}
+        self.detection_latency = {}
+
+    def on_result(self, result):
+        self.processed[result.camera_id] = self.processed.get(result.camera_id, 0) + 1
+        self.detection_latency.setdefault(result.camera_id, []).append(result.latency)
+        # handle_attendance_event receives the frame, not its capture time
+        self.capture_times[id(result.frame)] = (result.camera_id, result.captured_at)
+        while len(self.capture_times) > 512:
+            self.capture_times.popitem(last=False)
+
+
+def synthetic_rows(count, dim=512, seed=0):
+    """Random unit embeddings standing in for enrolled students"""
+    rng = np.random.default_rng(seed)
+    for sid in range(1, count + 1):
+        vector = rng.standard_normal(dim).astype(np.float32)
+        yield {
+            'id': sid,
+            'first_name': 'Synthetic',
+            'last_name': f'{sid:05d}',
+            'face_embedding': encode_embedding(vector / np.linalg.norm(vector)),
+        }
+
+
+def enrollment_rows(recognizer, args, first_id):
+    """
+    Real faces for the gallery, so the replayed people produce matches:
+    every image in --enroll, then up to --auto-enroll distinct faces
+    sampled from the first source.
+    """
+    embeddings = []
+    if args.enroll:
+        for name in sorted(os.listdir(args.enroll)):
+            if not name.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            with open(os.path.join(args.enroll, name), 'rb') as f:
+                embedding = recognizer.get_embedding(f.read())
+            if embedding is not None:
+                embeddings.append((os.path.splitext(name)[0], embedding))
+
+    if args.auto_enroll:
+        source = ReplaySource(args.source[0], fps=0)
+        seen = []
+        for n in range(args.auto_enroll_frames):
+            ret, frame = source.read()
+            if not ret:
+                break
+            if n % 5:
+                continue
+            for face in recognizer.analyze_batch([frame])[0]:
+                if face.embedding is None:
+                    continue
+                vector = face.embedding / np.linalg.norm(face.embedding)
+                if any(float(vector @ other) > 0.5 for other in seen):
+                    continue
+                seen.append(vector)
+                embeddings.append((f'Replay {len(seen)}', vector))
+            if len(seen) >= args.auto_enroll:
+                break
+        source.release()
+
+    return [
+        {'id': first_id + n, 'first_name': name, 'last_name': '(enrolled)', 'face_embedding': encode_embedding(embedding)}
+        for n, (name, embedding) in enumerate(embeddings)
+    ]
+
+
+def thread_cpu_seconds(native_id):
+    """CPU time (user + system) of one thread, from /proc on Linux; None elsewhere"""
+    try:
+        with open(f'/proc/self/task/{native_id}/stat') as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def cpu_sample(camera_ids):
+    """CPU seconds so far: whole process, each capture thread, inference workers, event loop"""
+    captures = {}
+    for camera_id in camera_ids:
+        stream = main.broadcasters[camera_id].stream
+        captures[camera_id] = thread_cpu_seconds(stream.thread.native_id) if stream else None
+    workers = [thread_cpu_seconds(worker.native_id) for worker in main.inference_pool.workers]
+    return {
+        'process': time.process_time(),
+        'captures': captures,
+        'inference': sum(workers) if None not in workers else None,
+        'event_loop': thread_cpu_seconds(threading.main_thread().native_id),
+    }
+
+
+def percentiles_ms(values):
+    if not values:
+        return None
+    p50, p95, p99 = np.percentile(np.array(values) * 1000, [50, 95, 99])
+    return {'p50': float(p50), 'p95': float(p95), 'p99': float(p99), 'count': len(values)}
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args):
+    camera_ids = list(range(1, args.cameras + 1))
+    sources = {f'replay://camera/{camera_id}': args.source[(camera_id - 1) % len(args.source)]
+               for camera_id in camera_ids}
+
+    # Models and the inference pool, exactly as the service starts them
+    await main.load_models()
+    if not main.startup.is_done('inference'):
+        raise SystemExit("No inference worker could load the models, see the log above")
+
+    # Gallery: synthetic students plus real faces that can actually match
+    print(f"Building gallery of {args.gallery} synthetic students...")
+    rows = list(synthetic_rows(args.gallery))
+    rows += enrollment_rows(main.face_recognizer, args, args.gallery + 1)
+    index = create_index(
+        args.index or main.GALLERY_INDEX,
+        nlist=main.GALLERY_IVF_NLIST, nprobe=main.GALLERY_IVF_NPROBE,
+        m=main.GALLERY_HNSW_M, ef=main.GALLERY_HNSW_EF
+    )
+    gallery = EmbeddingGallery(index=index)
+    gallery.load(rows)
+    print(f"Gallery ready: {len(gallery)} students ({len(rows) - args.gallery} real), index {index.kind}")
+
+    # Stand-ins for the database, MinIO and the backend
+    main.db_pool = SimpleNamespace()
+    main.gallery_service = SimpleNamespace(gallery=gallery)
+    session = {'id': 1, 'class_id': 1, 'type': 'regular', 'batch_students': None}
+    main.session_roster = SimpleNamespace(
+        student_sessions={row['id']: session for row in rows},
+        session_ids=frozenset([1]),
+        version=1,
+        candidates=[row['id'] for row in rows],
+    )
+    main.matcher = GalleryMatcher(main.gallery_service, main.session_roster, args.scope)
+    main.outbox = MemoryOutbox()
+    minio = NullMinio()
+    main.snapshot_uploader = SnapshotUploader(
+        minio, image_format=main.SNAPSHOT_FORMAT, quality=main.SNAPSHOT_QUALITY, max_side=main.SNAPSHOT_MAX_SIDE,
+        queue_size=main.SNAPSHOT_QUEUE_SIZE, upload_concurrency=main.SNAPSHOT_UPLOAD_CONCURRENCY,
+        encode_workers=main.SNAPSHOT_ENCODE_WORKERS
+    )
+    main.snapshot_uploader.start()
+    if args.cooldown is not None:
+        main.attendance_manager.cooldown = args.cooldown
+
+    # Observe the pipeline from the outside: results as they reach the
+    # event loop, and each attendance event with the frame it came from
+    recorder = Recorder()
+    pool_submit = main.inference_pool.submit
+
+    def submit(camera_id, seq, frame, captured_at, callback):
+        def on_result(result):
+            recorder.on_result(result)
+            callback(result)
+        return pool_submit(camera_id, seq, frame, captured_at, on_result)
+
+    main.inference_pool.submit = submit
+
+    handle_attendance_event = main.handle_attendance_event
+
+    async def traced_attendance_event(student_id, direction, camera_id, frame, bbox):
+        _event_origin.set(recorder.capture_times.get(id(frame)))
+        await handle_attendance_event(student_id, direction, camera_id, frame, bbox)
+
+    main.handle_attendance_event = traced_attendance_event
+
+    if args.any_direction:
+        # Recorded clips rarely walk the way each camera's door expects
+        main.determine_action = lambda camera_id, direction: "ENTRY" if camera_id % 2 else "EXIT"
+
+    main.RTSPStream = replay_stream_class(sources, args.fps)
+    main.should_run = True
+    tasks = [asyncio.create_task(main.process_stream(url, camera_id))
+             for camera_id, url in zip(camera_ids, sources)]
+
+    print(f"Warming up for {args.warmup:g}s...")
+    await asyncio.sleep(args.warmup)
+    recorder.reset()
+    main.outbox.events.clear()
+    stage_timings.reset()
+    pool_start = main.inference_pool.snapshot()['cameras']
+    seq_start = {camera_id: main.broadcasters[camera_id].stream.seq for camera_id in camera_ids}
+    cpu_start = cpu_sample(camera_ids)
+
+    print(f"Measuring for {args.duration:g}s...")
+    await asyncio.sleep(args.duration)
+    elapsed = time.time() - recorder.started
+    cpu_end = cpu_sample(camera_ids)
+    pool_end = main.inference_pool.snapshot()['cameras']
+    seq_end = {camera_id: main.broadcasters[camera_id].stream.seq for camera_id in camera_ids}
+    events = list(main.outbox.events)
+
+    main.should_run = False
+    await asyncio.gather(*tasks, return_exceptions=True)
+    main.inference_pool.stop()
+    await main.snapshot_uploader.close(timeout=2.0)
+
+    return report(args, camera_ids, sources, gallery, elapsed, recorder, events,
+                  seq_start, seq_end, pool_start, pool_end, cpu_start, cpu_end, minio)
+
+
+def cpu_delta(start, end, elapsed):
+    if start is None or end is None:
+        return None
+    return (end - start) / elapsed * 100
+
+
+def report(args, camera_ids, sources, gallery, elapsed, recorder, events,
+           seq_start, seq_end, pool_start, pool_end, cpu_start, cpu_end, minio):
+    total_processed = sum(recorder.processed.values()) or 1
+    shared_cpu = [cpu_delta(cpu_start[part], cpu_end[part], elapsed) for part in ('inference', 'event_loop')]
+
+    cameras = {}
+    for camera_id, url in zip(camera_ids, sources):
+        processed = recorder.processed.get(camera_id, 0)
+        camera_events = [event for event in events if event['camera_id'] == camera_id]
+        capture_cpu = cpu_delta(cpu_start['captures'][camera_id], cpu_end['captures'][camera_id], elapsed)
+        # Inference workers and the event loop serve every camera: split them by processed frames
+        share = processed / total_processed
+        cpu = None
+        if capture_cpu is not None and None not in shared_cpu:
+            cpu = capture_cpu + share * sum(shared_cpu)
+        start = pool_start.get(camera_id, {})
+        end = pool_end.get(camera_id, {})
+        cameras[str(camera_id)] = {
+            'source': sources[url],
+            'captured_fps': (seq_end[camera_id] - seq_start[camera_id]) / elapsed,
+            'processed_fps': processed / elapsed,
+            'dropped_frames': end.get('dropped', 0) - start.get('dropped', 0),
+            'frame_to_detection_ms': percentiles_ms(recorder.detection_latency.get(camera_id, [])),
+            'frame_to_event_ms': percentiles_ms([event['latency'] for event in camera_events
+                                                 if event['latency'] is not None]),
+            'events': len(camera_events),
+            'cpu_percent': cpu,
+            'capture_cpu_percent': capture_cpu,
+        }
+
+    return {
+        'benchmark': 'replay',
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'config': {
+            'sources': args.source,
+            'cameras': args.cameras,
+            'fps': args.fps,
+            'duration_s': args.duration,
+            'warmup_s': args.warmup,
+            'gallery': len(gallery),
+            'index': gallery.index.kind,
+            'scope': args.scope,
+            'inference_workers': main.inference_pool.num_workers,
+            'max_batch': main.INFERENCE_MAX_BATCH,
+            'det_size': main.DET_SIZE,
+            'process_every_n': main.PROCESS_EVERY_N,
+            'frame_size': main.FRAME_SIZE,
+            'motion_gating': main.MOTION_GATING,
+            'face_tracking': main.FACE_TRACKING,
+            'cpus': os.cpu_count(),
+        },
+        'elapsed_s': elapsed,
+        'cameras': cameras,
+        'totals': {
+            'processed_fps': sum(recorder.processed.values()) / elapsed,
+            'events': len(events),
+            'snapshots': minio.objects,
+            'process_cpu_percent': cpu_delta(cpu_start['process'], cpu_end['process'], elapsed),
+            'inference_cpu_percent': shared_cpu[0],
+            'event_loop_cpu_percent': shared_cpu[1],
+            'frame_to_detection_ms': percentiles_ms(
+                [latency for latencies in recorder.detection_latency.values() for latency in latencies]
+            ),
+            'frame_to_event_ms': percentiles_ms([event['latency'] for event in events if event['latency'] is not None]),
+        },
+        'stages': stage_timings.snapshot(),
+    }
+
+
+def compare(result, baseline):
+    """Print the headline numbers next to a previous run's"""
+    def fmt(value):
+        return f"{value:9.1f}" if isinstance(value, (int, float)) else f"{'-':>9}"
+
+    def line(label, new, old):
+        change = ''
+        if isinstance(new, (int, float)) and isinstance(old, (int, float)) and old:
+            change = f"{(new - old) / old * 100:+7.1f}%"
+        print(f"  {label:<28}{fmt(old)} ->{fmt(new)} {change}")
+
+    print(f"\nCompared with {baseline.get('commit')} ({baseline.get('timestamp')}):")
+    new_totals, old_totals = result['totals'], baseline.get('totals', {})
+    line('processed fps', new_totals['processed_fps'], old_totals.get('processed_fps'))
+    for key in ('frame_to_detection_ms', 'frame_to_event_ms'):
+        for p in ('p50', 'p95', 'p99'):
+            line(f'{key[:-3]} {p} ms', (new_totals[key] or {}).get(p), (old_totals.get(key) or {}).get(p))
+    line('process cpu %', new_totals['process_cpu_percent'], old_totals.get('process_cpu_percent'))
+    for camera_id, camera in result['cameras'].items():
+        old = baseline.get('cameras', {}).get(camera_id, {})
+        line(f'camera {camera_id} processed fps', camera['processed_fps'], old.get('processed_fps'))
+
+
+def print_summary(result):
+    print(f"\n{result['config']['cameras']} camera(s), gallery {result['config']['gallery']}, "
+          f"{result['elapsed_s']:.1f}s measured")
+    for camera_id, camera in result['cameras'].items():
+        detection = camera['frame_to_detection_ms'] or {}
+        event = camera['frame_to_event_ms'] or {}
+        cpu = camera['cpu_percent']
+        print(f"  Camera {camera_id}: captured {camera['captured_fps']:.1f} fps, processed {camera['processed_fps']:.1f} fps, "
+              f"detection p50/p95/p99 {detection.get('p50', 0):.0f}/{detection.get('p95', 0):.0f}/{detection.get('p99', 0):.0f} ms, "
+              f"events {camera['events']} (p95 {event.get('p95', 0):.0f} ms), "
+              f"cpu {'-' if cpu is None else f'{cpu:.0f}%'}")
+    totals = result['totals']
+    print(f"  Total: {totals['processed_fps']:.1f} fps processed, {totals['events']} events, "
+          f"process cpu {totals['process_cpu_percent']:.0f}%")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Replay recorded video through the recognition pipeline")
+    parser.add_argument("--source", action="append", required=True,
+                        help="Video file, image directory or glob; repeat for several (cycled across cameras)")
+    parser.add_argument("--cameras", type=int, default=1, help="Number of simulated cameras (default 1)")
+    parser.add_argument("--fps", type=float, default=None,
+                        help="Replay rate per camera; default the video's own rate (25 for images), 0 = as fast as possible")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds to measure (default 30)")
+    parser.add_argument("--warmup", type=float, default=5.0, help="Seconds to run before measuring (default 5)")
+    parser.add_argument("--gallery", type=int, default=1000, help="Synthetic gallery size, e.g. 1000/10000/50000")
+    parser.add_argument("--index", choices=["exact", "ivf", "hnsw"], default=None,
+                        help="Gallery index (default GALLERY_INDEX)")
+    parser.add_argument("--scope", choices=["session", "all"], default="all",
+                        help="Match scope; every student is in the benchmark session, so both search the whole gallery")
+    parser.add_argument("--enroll", default=None, help="Directory of face photos to add to the gallery (name = file name)")
+    parser.add_argument("--auto-enroll", type=int, default=5,
+                        help="Enroll up to N distinct faces found in the first source (default 5, 0 disables)")
+    parser.add_argument("--auto-enroll-frames", type=int, default=300,
+                        help="Frames of the first source scanned for --auto-enroll (default 300)")
+    parser.add_argument("--any-direction", action="store_true",
+                        help="Raise an event for movement in any direction, not only each camera's door direction")
+    parser.add_argument("--cooldown", type=float, default=None, help="Seconds between events per student (default 60)")
+    parser.add_argument("--output", default=None, help="JSON result path (default benchmarks/results/replay_<time>_<commit>.json)")
+    parser.add_argument("--baseline", default=None, help="Earlier result JSON to compare against")
+    return parser.parse_args(argv)
+
+
+def main_cli(argv=None):
+    args = parse_args(argv)
+    result = asyncio.run(run(args))
+
+    output = args.output
+    if output is None:
+        directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        output = os.path.join(directory, f"replay_{stamp}_{result['commit'] or 'nocommit'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(result, f, indent=2)
+
+    print_summary(result)
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(result, json.load(f))
+    print(f"\nResults saved to {output}")
+
+
+if __name__ == "__main__":
+    main_cli()
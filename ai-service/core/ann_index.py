@@ -0,0 +1,477 @@
+import os
+import threading
+import time
+import numpy as np
+
+
+def normalize(matrix):
+    """L2-normalize rows into a contiguous float32 matrix"""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return np.ascontiguousarray(matrix / norms, dtype=np.float32)
+
+
+def _empty_result(n):
+    return np.zeros((n, 0), dtype=np.int64), np.zeros((n, 0), dtype=np.float32)
+
+
+def _top_k(scores, k):
+    """Column indices and values of the k best scores per row, sorted descending"""
+    if k < scores.shape[1]:
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        top = np.tile(np.arange(scores.shape[1]), (scores.shape[0], 1))
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    order = np.argsort(-top_scores, axis=1)
+    return np.take_along_axis(top, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+
+
+class BruteForceIndex:
+    """
+    Exact cosine search: one matmul against every stored vector.
+    Updates build a new (vectors, ids, positions) snapshot and swap it in,
+    so searches never see a half-applied change.
+    """
+
+    kind = 'exact'
+
+    def __init__(self, dim=512):
+        self.dim = dim
+        self._snapshot = (np.zeros((0, dim), dtype=np.float32), np.zeros((0,), dtype=np.int64), {})
+
+    def __len__(self):
+        return len(self._snapshot[1])
+
+    def items(self):
+        """Returns: (ids, vectors) currently stored, row-aligned"""
+        return self._snapshot[1], self._snapshot[0]
+
+    def vectors_for(self, ids):
+        """Returns: (ids, vectors) for the requested ids that are stored"""
+        matrix, _, positions = self._snapshot
+        found = [int(sid) for sid in ids if int(sid) in positions]
+        return (np.asarray(found, dtype=np.int64),
+                matrix[[positions[sid] for sid in found]].reshape(-1, self.dim))
+
+    def build(self, ids, vectors):
+        """Replace the whole index. vectors must already be normalized."""
+        ids = np.asarray(ids, dtype=np.int64)
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        self._snapshot = (np.ascontiguousarray(vectors), ids,
+                          {sid: pos for pos, sid in enumerate(ids.tolist())})
+
+    def update(self, ids=(), vectors=None, removed_ids=()):
+        """Upsert (ids, vectors) and drop removed_ids in one swap"""
+        matrix, all_ids, positions = self._snapshot
+        drop = {int(sid) for sid in removed_ids} & positions.keys()
+        replaced = {}
+        appended = {}
+        for sid, vector in zip((int(sid) for sid in ids), vectors if vectors is not None else ()):
+            drop.discard(sid)
+            if sid in positions:
+                replaced[positions[sid]] = vector
+            else:
+                appended[sid] = vector
+
+        if not replaced and not appended and not drop:
+            return
+
+        if replaced:
+            matrix = matrix.copy()
+            rows_at = np.fromiter(replaced.keys(), dtype=np.int64, count=len(replaced))
+            matrix[rows_at] = np.vstack(list(replaced.values()))
+
+        if appended:
+            matrix = np.vstack([matrix, np.vstack(list(appended.values()))])
+            all_ids = np.concatenate([all_ids, np.fromiter(appended.keys(), dtype=np.int64, count=len(appended))])
+
+        if drop:
+            keep = ~np.isin(all_ids, np.fromiter(drop, dtype=np.int64, count=len(drop)))
+            matrix = np.ascontiguousarray(matrix[keep])
+            all_ids = all_ids[keep]
+            positions = {sid: pos for pos, sid in enumerate(all_ids.tolist())}
+        elif appended:
+            positions = dict(positions)
+            for sid in appended:
+                positions[sid] = len(positions)
+
+        self._snapshot = (matrix, all_ids, positions)
+
+    def search(self, queries, k=1):
+        """queries must be normalized. Returns (ids, scores), both (n, k)"""
+        matrix, ids, _ = self._snapshot
+        k = min(k, len(ids))
+        if k == 0 or len(queries) == 0:
+            return _empty_result(len(queries))
+        top, scores = _top_k(queries @ matrix.T, k)
+        return ids[top], scores
+
+    def save(self, directory):
+        matrix, ids, _ = self._snapshot
+        np.savez(os.path.join(directory, 'exact_index.npz'), ids=ids, vectors=matrix)
+
+    def load(self, directory):
+        path = os.path.join(directory, 'exact_index.npz')
+        if not os.path.exists(path):
+            return False
+        data = np.load(path)
+        self.build(data['ids'], data['vectors'])
+        return True
+
+
+class IVFIndex:
+    """
+    Inverted-file index in pure NumPy.
+    Vectors are bucketed by their nearest k-means centroid, and a query only
+    scans the nprobe closest buckets. Adds and removes rewrite only the
+    buckets they touch. The centroids are retrained when the index grows
+    well past the size it was trained on.
+    """
+
+    kind = 'ivf'
+
+    def __init__(self, dim=512, nlist=0, nprobe=8, train_iterations=10, retrain_growth=4.0):
+        self.dim = dim
+        self.nlist = nlist  # 0 = choose from gallery size
+        self.nprobe = nprobe
+        self.train_iterations = train_iterations
+        self.retrain_growth = retrain_growth
+        self.trained_size = 0
+        # (centroids, lists, where) swapped as one tuple
+        # lists: tuple of (ids, vectors) per centroid, where: { id: list number }
+        self._snapshot = (np.zeros((1, dim), dtype=np.float32),
+                          ((np.zeros((0,), dtype=np.int64), np.zeros((0, dim), dtype=np.float32)),), {})
+        self._write_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._snapshot[2])
+
+    def items(self):
+        return self._collect(self._snapshot[1])
+
+    def vectors_for(self, ids):
+        _, lists, where = self._snapshot
+        found = []
+        vectors = []
+        for sid in ids:
+            sid = int(sid)
+            if sid not in where:
+                continue
+            list_ids, list_vectors = lists[where[sid]]
+            found.append(sid)
+            vectors.append(list_vectors[np.flatnonzero(list_ids == sid)[0]])
+        if not found:
+            return np.zeros((0,), dtype=np.int64), np.zeros((0, self.dim), dtype=np.float32)
+        return np.asarray(found, dtype=np.int64), np.vstack(vectors)
+
+    def build(self, ids, vectors):
+        ids = np.asarray(ids, dtype=np.int64)
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        with self._write_lock:
+            self._snapshot = self._build(ids, vectors)
+
+    def update(self, ids=(), vectors=None, removed_ids=()):
+        ids = np.asarray(list(ids), dtype=np.int64)
+        vectors = np.asarray(vectors if vectors is not None else [], dtype=np.float32).reshape(-1, self.dim)
+
+        with self._write_lock:
+            centroids, lists, where = self._snapshot
+            stale = {int(sid) for sid in removed_ids} | set(ids.tolist())
+            touched = {where[sid] for sid in stale if sid in where}
+            new_size = len(where) - sum(1 for sid in stale if sid in where) + len(ids)
+
+            if new_size > max(self.trained_size, 1) * self.retrain_growth:
+                all_ids, all_vectors = self._collect(lists, exclude=stale)
+                self._snapshot = self._build(np.concatenate([all_ids, ids]),
+                                             np.vstack([all_vectors, vectors]))
+                return
+
+            assignments = np.argmax(vectors @ centroids.T, axis=1) if len(ids) else np.zeros((0,), dtype=np.int64)
+            touched |= set(assignments.tolist())
+            if not touched:
+                return
+
+            lists = list(lists)
+            where = dict(where)
+            for sid in stale:
+                where.pop(sid, None)
+            stale = np.fromiter(stale, dtype=np.int64, count=len(stale))
+            for number in touched:
+                list_ids, list_vectors = lists[number]
+                keep = ~np.isin(list_ids, stale)
+                mask = assignments == number
+                lists[number] = (np.concatenate([list_ids[keep], ids[mask]]),
+                                 np.vstack([list_vectors[keep], vectors[mask]]))
+            for sid, number in zip(ids.tolist(), assignments.tolist()):
+                where[sid] = number
+
+            self._snapshot = (centroids, tuple(lists), where)
+
+    def search(self, queries, k=1):
+        centroids, lists, where = self._snapshot
+        k = min(k, len(where))
+        if k == 0 or len(queries) == 0:
+            return _empty_result(len(queries))
+
+        nprobe = min(self.nprobe, len(centroids))
+        probes, _ = _top_k(queries @ centroids.T, nprobe)
+
+        result_ids = np.full((len(queries), k), -1, dtype=np.int64)
+        result_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        for row, (query, probe) in enumerate(zip(queries, probes)):
+            candidate_ids = np.concatenate([lists[number][0] for number in probe])
+            if len(candidate_ids) == 0:
+                continue
+            candidate_vectors = np.vstack([lists[number][1] for number in probe])
+            top, scores = _top_k((candidate_vectors @ query)[None, :], min(k, len(candidate_ids)))
+            result_ids[row, :top.shape[1]] = candidate_ids[top[0]]
+            result_scores[row, :top.shape[1]] = scores[0]
+        return result_ids, result_scores
+
+    def save(self, directory):
+        centroids, lists, _ = self._snapshot
+        ids, vectors = self._collect(lists)
+        sizes = np.array([len(list_ids) for list_ids, _ in lists], dtype=np.int64)
+        np.savez(os.path.join(directory, 'ivf_index.npz'), centroids=centroids, ids=ids,
+                 vectors=vectors, sizes=sizes, trained_size=self.trained_size)
+
+    def load(self, directory):
+        path = os.path.join(directory, 'ivf_index.npz')
+        if not os.path.exists(path):
+            return False
+        data = np.load(path)
+        # Every NpzFile lookup reads the array from disk again, so read each one once
+        ids = data['ids']
+        vectors = data['vectors']
+        bounds = np.concatenate([[0], np.cumsum(data['sizes'])])
+        lists = tuple((ids[start:end], vectors[start:end])
+                      for start, end in zip(bounds[:-1], bounds[1:]))
+        where = {}
+        for number, (list_ids, _) in enumerate(lists):
+            for sid in list_ids.tolist():
+                where[sid] = number
+        with self._write_lock:
+            self.trained_size = int(data['trained_size'])
+            self._snapshot = (data['centroids'], lists, where)
+        return True
+
+    def _build(self, ids, vectors):
+        centroids = self._train(vectors)
+        assignments = np.argmax(vectors @ centroids.T, axis=1) if len(ids) else np.zeros((0,), dtype=np.int64)
+        lists = tuple((ids[assignments == number], np.ascontiguousarray(vectors[assignments == number]))
+                      for number in range(len(centroids)))
+        self.trained_size = len(ids)
+        return centroids, lists, dict(zip(ids.tolist(), assignments.tolist()))
+
+    def _train(self, vectors):
+        """Spherical k-means on (a sample of) the vectors"""
+        n = len(vectors)
+        nlist = self.nlist or int(4 * np.sqrt(n))
+        nlist = max(1, min(nlist, n))
+        if n == 0:
+            return np.zeros((1, self.dim), dtype=np.float32)
+
+        rng = np.random.default_rng(0)
+        sample = vectors[rng.choice(n, min(n, nlist * 64), replace=False)]
+        centroids = sample[rng.choice(len(sample), nlist, replace=False)]
+        for _ in range(self.train_iterations):
+            assignments = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, sample)
+            empty = ~np.bincount(assignments, minlength=nlist).astype(bool)
+            sums[empty] = centroids[empty]
+            centroids = normalize(sums)
+        return centroids
+
+    def _collect(self, lists, exclude=()):
+        ids = np.concatenate([list_ids for list_ids, _ in lists])
+        vectors = np.vstack([list_vectors for _, list_vectors in lists])
+        if exclude:
+            keep = ~np.isin(ids, list(exclude))
+            ids, vectors = ids[keep], vectors[keep]
+        return ids, vectors
+
+
+class HNSWIndex:
+    """
+    Graph-based ANN index backed by hnswlib (optional dependency).
+    Removal marks the element deleted; re-adding the same id restores it.
+    """
+
+    kind = 'hnsw'
+
+    def __init__(self, dim=512, m=16, ef_construction=200, ef=64, initial_capacity=1024):
+        try:
+            import hnswlib
+        except ImportError:
+            raise ImportError("GALLERY_INDEX=hnsw requires the hnswlib package (pip install hnswlib)")
+
+        self._hnswlib = hnswlib
+        self.dim = dim
+        self.m = m
+        self.ef_construction = ef_construction
+        self.ef = ef
+        self.initial_capacity = initial_capacity
+        self._lock = threading.Lock()
+        self._live = set()
+        self._index = self._new_index(initial_capacity)
+
+    def __len__(self):
+        return len(self._live)
+
+    def items(self):
+        with self._lock:
+            ids = np.fromiter(self._live, dtype=np.int64, count=len(self._live))
+            if not len(ids):
+                return ids, np.zeros((0, self.dim), dtype=np.float32)
+            return ids, np.asarray(self._index.get_items(ids), dtype=np.float32)
+
+    def vectors_for(self, ids):
+        with self._lock:
+            found = np.asarray([int(sid) for sid in ids if int(sid) in self._live], dtype=np.int64)
+            if not len(found):
+                return found, np.zeros((0, self.dim), dtype=np.float32)
+            return found, np.asarray(self._index.get_items(found), dtype=np.float32)
+
+    def build(self, ids, vectors):
+        ids = np.asarray(ids, dtype=np.int64)
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        index = self._new_index(max(self.initial_capacity, len(ids) * 2))
+        if len(ids):
+            index.add_items(vectors, ids)
+        with self._lock:
+            self._index = index
+            self._live = set(ids.tolist())
+
+    def update(self, ids=(), vectors=None, removed_ids=()):
+        ids = np.asarray(list(ids), dtype=np.int64)
+        upserted = set(ids.tolist())
+        with self._lock:
+            for sid in removed_ids:
+                sid = int(sid)
+                if sid in self._live and sid not in upserted:
+                    self._index.mark_deleted(sid)
+                    self._live.discard(sid)
+
+            if len(ids):
+                needed = self._index.get_current_count() + len(ids)
+                if needed > self._index.get_max_elements():
+                    self._index.resize_index(max(needed, self._index.get_max_elements() * 2))
+                self._index.add_items(np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim), ids)
+                self._live.update(upserted)
+
+    def search(self, queries, k=1):
+        with self._lock:
+            k = min(k, len(self._live))
+            if k == 0 or len(queries) == 0:
+                return _empty_result(len(queries))
+            self._index.set_ef(max(self.ef, k))
+            labels, distances = self._index.knn_query(queries, k=k)
+        # 'ip' space reports 1 - dot product
+        return labels.astype(np.int64), (1.0 - distances).astype(np.float32)
+
+    def save(self, directory):
+        with self._lock:
+            self._index.save_index(os.path.join(directory, 'hnsw_index.bin'))
+            np.save(os.path.join(directory, 'hnsw_ids.npy'),
+                    np.fromiter(self._live, dtype=np.int64, count=len(self._live)))
+
+    def load(self, directory):
+        path = os.path.join(directory, 'hnsw_index.bin')
+        ids_path = os.path.join(directory, 'hnsw_ids.npy')
+        if not os.path.exists(path) or not os.path.exists(ids_path):
+            return False
+        index = self._hnswlib.Index(space='ip', dim=self.dim)
+        index.load_index(path)
+        index.set_ef(self.ef)
+        with self._lock:
+            self._index = index
+            self._live = set(np.load(ids_path).tolist())
+        return True
+
+    def _new_index(self, capacity):
+        index = self._hnswlib.Index(space='ip', dim=self.dim)
+        index.init_index(max_elements=capacity, ef_construction=self.ef_construction, M=self.m)
+        index.set_ef(self.ef)
+        return index
+
+
+def create_index(kind='exact', dim=512, **params):
+    """
+    Build an index from config.
+    kind: 'exact' (default), 'ivf' or 'hnsw'
+    """
+    if kind == 'exact':
+        return BruteForceIndex(dim)
+    if kind == 'ivf':
+        return IVFIndex(dim, nlist=params.get('nlist', 0), nprobe=params.get('nprobe', 8))
+    if kind == 'hnsw':
+        return HNSWIndex(dim, m=params.get('m', 16), ef=params.get('ef', 64))
+    raise ValueError(f"Unknown gallery index '{kind}' (expected exact, ivf or hnsw)")
+
+
+def recall_report(index, k=1, num_queries=200, noise=0.3, seed=0):
+    """
+    Compare an index against exact search on its own contents.
+    Queries are stored vectors with gaussian noise, roughly the spread of
+    two captures of the same face.
+    Returns: dict with recall@k and per-query latency for both searches
+    """
+    ids, vectors = index.items()
+    if len(vectors) == 0:
+        return {'index': index.kind, 'size': 0}
+
+    exact = BruteForceIndex(index.dim)
+    exact.build(ids, vectors)
+
+    rng = np.random.default_rng(seed)
+    picks = rng.choice(len(vectors), min(num_queries, len(vectors)), replace=False)
+    queries = normalize(vectors[picks] + rng.normal(scale=noise / np.sqrt(index.dim),
+                                                    size=(len(picks), index.dim)))
+
+    def timed(target):
+        latencies = []
+        results = []
+        for query in queries:
+            start = time.perf_counter()
+            found, _ = target.search(query[None, :], k)
+            latencies.append((time.perf_counter() - start) * 1000)
+            results.append(set(found[0].tolist()))
+        return results, latencies
+
+    truth, exact_ms = timed(exact)
+    found, index_ms = timed(index)
+    hits = sum(len(t & f) for t, f in zip(truth, found))
+
+    return {
+        'index': index.kind,
+        'size': len(vectors),
+        'queries': len(queries),
+        'k': k,
+        f'recall_at_{k}': hits / max(1, sum(len(t) for t in truth)),
+        'exact_ms_p50': float(np.percentile(exact_ms, 50)),
+        'exact_ms_p95': float(np.percentile(exact_ms, 95)),
+        'index_ms_p50': float(np.percentile(index_ms, 50)),
+        'index_ms_p95': float(np.percentile(index_ms, 95)),
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Recall/latency of a gallery index on synthetic embeddings")
+    parser.add_argument("--kind", default="ivf", choices=["exact", "ivf", "hnsw"])
+    parser.add_argument("--size", type=int, default=50000)
+    parser.add_argument("--k", type=int, default=1)
+    parser.add_argument("--nprobe", type=int, default=8)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(1)
+    data = normalize(rng.normal(size=(args.size, 512)))
+    index = create_index(args.kind, nprobe=args.nprobe)
+    start = time.perf_counter()
+    index.build(np.arange(1, args.size + 1), data)
+    print(f"Built {args.kind} index over {args.size} vectors in {time.perf_counter() - start:.2f}s")
+    print(json.dumps(recall_report(index, k=args.k), indent=2))
@@ -62,6 +62,11 @@ class AttendanceManager:
     def mark_event(self, face_id):
         self.faces[face_id]['last_event'] = time.time()
 
+    def clear_event(self, face_id):
+        # Lift the cooldown again, e.g. when the attendance mark failed
+        if face_id in self.faces:
+            self.faces[face_id]['last_event'] = 0
+
     def cleanup(self):
         # Remove old faces to save memory
         now = time.time()
@@ -0,0 +1,161 @@
+import asyncio
+import httpx
+from core import metrics
+
+# The backend's MAX_MARK_BATCH; larger batches are refused with a 400
+MAX_MARK_BATCH = 100
+
+
+class AttendanceSender:
+    """
+    Delivers attendance marks to the backend without blocking the event
+    loop. Marks arriving within `window` seconds of each other are
+    coalesced into one POST /api/attendance/mark/batch over a pooled
+    keep-alive client; batches are sent concurrently, retried with
+    exponential backoff on network errors and 5xx, and each caller gets
+    the backend's result for its own event. Falls back to the single
+    /mark endpoint if the backend has no batch route. A batch request the
+    backend refuses as a whole fails every event in it as transient, so
+    the outbox retries them rather than dropping them.
+    """
+
+    def __init__(self, base_url, window=0.05, max_batch=50, retries=3, backoff=0.5,
+                 timeout=5.0, max_connections=10):
+        self.base_url = base_url
+        self.window = window
+        if max_batch > MAX_MARK_BATCH:
+            print(f"Attendance batch size {max_batch} is above the backend limit, using {MAX_MARK_BATCH}")
+        self.max_batch = max(1, min(max_batch, MAX_MARK_BATCH))
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.client = None
+        self.pending = []  # [(event, future)]
+        self.batch_supported = True
+        self.sent_batches = 0
+        self.sent_events = 0
+        self.failed_events = 0
+        self.retried = 0
+        self._wake = asyncio.Event()
+        self._task = None
+        self._inflight = set()
+
+    def start(self):
+        self.client = httpx.AsyncClient(
+            base_url=self.base_url,
+            timeout=self.timeout,
+            limits=httpx.Limits(max_connections=self.max_connections,
+                                max_keepalive_connections=self.max_connections)
+        )
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+        if self._inflight:
+            await asyncio.gather(*self._inflight, return_exceptions=True)
+        if self.client is not None:
+            await self.client.aclose()
+
+    async def send(self, event):
+        """
+        Queue one event body (as built by the outbox, with its idempotencyKey) and wait for its result.
+        Returns: dict with 'success', 'httpStatus' and the backend's response fields
+        """
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((event, future))
+        self._wake.set()
+        return await future
+
+    def stats(self):
+        return {
+            'pending': len(self.pending),
+            'inflight_batches': len(self._inflight),
+            'sent_batches': self.sent_batches,
+            'sent_events': self.sent_events,
+            'failed_events': self.failed_events,
+            'retries': self.retried,
+        }
+
+    async def _run(self):
+        while True:
+            await self._wake.wait()
+            # Let a burst of marks gather before sending
+            await asyncio.sleep(self.window)
+            self._wake.clear()
+
+            while self.pending:
+                batch, self.pending = self.pending[:self.max_batch], self.pending[self.max_batch:]
+                task = asyncio.create_task(self._deliver(batch))
+                self._inflight.add(task)
+                task.add_done_callback(self._inflight.discard)
+
+    async def _deliver(self, batch):
+        try:
+            results = await self._with_retries(self._post_batch, [event for event, _ in batch])
+        except Exception as e:
+            results = [{"success": False, "httpStatus": None, "error": str(e)} for _ in batch]
+
+        self.sent_batches += 1
+        for (_, future), result in zip(batch, results):
+            result.setdefault("success", result.get("httpStatus") in (200, 201))
+            if not result["success"]:
+                self.failed_events += 1
+            self.sent_events += 1
+            if not future.done():
+                future.set_result(result)
+
+    async def _with_retries(self, send, events):
+        for attempt in range(self.retries + 1):
+            try:
+                with metrics.timed('backend_mark'):
+                    return await send(events)
+            except (httpx.HTTPError, _ServerError) as e:
+                if attempt == self.retries:
+                    raise
+                self.retried += 1
+                print(f"Attendance delivery failed ({e}), retrying in {self.backoff * 2 ** attempt:.1f}s")
+                await asyncio.sleep(self.backoff * 2 ** attempt)
+
+    async def _post_batch(self, events):
+        if not self.batch_supported:
+            return await self._post_single(events)
+
+        response = await self.client.post("/api/attendance/mark/batch", json={"events": events})
+        if response.status_code == 404:
+            print("Backend has no batch mark endpoint, sending marks one by one")
+            self.batch_supported = False
+            return await self._post_single(events)
+        if response.status_code >= 500:
+            raise _ServerError(response.status_code)
+        if response.status_code != 200:
+            # Refused as a whole (oversized batch, proxy limit...): nothing says the events themselves are bad
+            raise _BatchRefused(response.status_code, response.text)
+        return response.json()["results"]
+
+    async def _post_single(self, events):
+        async def post(event):
+            response = await self.client.post("/api/attendance/mark", json=event)
+            if response.status_code >= 500:
+                raise _ServerError(response.status_code)
+            try:
+                body = response.json()
+            except ValueError:
+                body = {"error": response.text}
+            return {**body, "httpStatus": response.status_code}
+
+        # Per-event retries are handled by the caller for the whole group
+        return list(await asyncio.gather(*(post(event) for event in events)))
+
+
+class _ServerError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"backend returned {status_code}")
+        self.status_code = status_code
+
+
+class _BatchRefused(Exception):
+    def __init__(self, status_code, text):
+        super().__init__(f"backend refused the batch with {status_code}: {text}")
+        self.status_code = status_code
@@ -1,6 +1,10 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 import cv2
 import numpy as np
-from rembg import remove
 from PIL import Image
 import io
 import base64
@@ -8,128 +12,254 @@ import base64
 class BackgroundRemover:
     """
     Background removal service for face photos
-    Uses rembg library for AI-powered background segmentation
+    Uses rembg library for AI-powered background segmentation, with one
+    model session created (and warmed) up front and reused for every call
     """
-    
-    def __init__(self):
-        """Initialize the background remover"""
-        # rembg will auto-download models on first use
-        pass
-    
+
+    def __init__(self, model_name: str = 'u2net'):
+        """
+        Initialize the background remover
+
+        Args:
+            model_name: rembg model, e.g. 'u2net' (default), or the lighter 'u2netp' / 'silueta'
+        """
+        # Imported here so only the processes that remove backgrounds load rembg
+        from rembg import new_session, remove
+        self.model_name = model_name
+        self._remove = remove
+        # rembg downloads the model on first use; the session keeps it loaded
+        self.session = new_session(model_name)
+
+    def warm(self):
+        """Run one tiny image through the model so the first request does not pay for initialization"""
+        self._remove(Image.new('RGB', (64, 64)), session=self.session)
+
     def remove_background(self, image_bytes: bytes) -> bytes:
         """
         Remove background from image
-        
+
         Args:
             image_bytes: Input image as bytes
-            
+
         Returns:
             bytes: Processed image with transparent background as PNG bytes
         """
         try:
             # Convert bytes to PIL Image
             input_image = Image.open(io.BytesIO(image_bytes))
-            
-            # Remove background
-            output_image = remove(input_image)
-            
-            # Convert to bytes
-            output_buffer = io.BytesIO()
-            output_image.save(output_buffer, format='PNG')
-            output_bytes = output_buffer.getvalue()
-            
-            return output_bytes
-            
+
+            return self._remove_to_png(input_image)
+
         except Exception as e:
             print(f"Background removal error: {e}")
             raise
-    
+
     def remove_background_base64(self, base64_image: str) -> str:
         """
         Remove background from base64 encoded image
-        
+
         Args:
             base64_image: Base64 encoded image (with or without data URI prefix)
-            
+
         Returns:
             str: Base64 encoded PNG with transparent background
         """
         try:
-            # Remove data URI prefix if present
-            if ',' in base64_image:
-                base64_image = base64_image.split(',')[1]
-            
-            # Decode base64 to bytes
-            image_bytes = base64.b64decode(base64_image)
-            
             # Process image
-            processed_bytes = self.remove_background(image_bytes)
-            
-            # Encode back to base64
-            processed_base64 = base64.b64encode(processed_bytes).decode('utf-8')
-            
-            # Add data URI prefix for PNG
-            return f"data:image/png;base64,{processed_base64}"
-            
+            processed_bytes = self.remove_background(decode_base64_image(base64_image))
+
+            return png_data_uri(processed_bytes)
+
         except Exception as e:
             print(f"Base64 background removal error: {e}")
             raise
-    
-    def remove_background_with_face_crop(self, image_bytes: bytes, padding: float = 0.3) -> bytes:
+
+    def remove_background_with_face_crop(self, image_bytes: bytes, face_box=None, padding: float = 0.3) -> bytes:
         """
         Remove background and crop to face region
-        
+
         Args:
             image_bytes: Input image as bytes
+            face_box: Face bounding box (x1, y1, x2, y2) from the face detector, None if no face was found
             padding: Padding around face bounding box (0.3 = 30% padding)
-            
+
         Returns:
             bytes: Cropped image with transparent background
         """
+        if face_box is None:
+            # No face detected, process entire image
+            return self.remove_background(image_bytes)
+
         try:
             # Convert bytes to numpy array
             nparr = np.frombuffer(image_bytes, np.uint8)
             img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-            
-            # Detect face using OpenCV
-            face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
-            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-            faces = face_cascade.detectMultiScale(gray, 1.1, 4)
-            
-            if len(faces) == 0:
-                # No face detected, process entire image
-                return self.remove_background(image_bytes)
-            
-            # Get largest face
-            largest_face = max(faces, key=lambda f: f[2] * f[3])
-            x, y, w, h = largest_face
-            
+
+            x1, y1, x2, y2 = [int(v) for v in face_box]
+
             # Add padding
-            pad_w = int(w * padding)
-            pad_h = int(h * padding)
-            
-            x1 = max(0, x - pad_w)
-            y1 = max(0, y - pad_h)
-            x2 = min(img.shape[1], x + w + pad_w)
-            y2 = min(img.shape[0], y + h + pad_h)
-            
+            pad_w = int((x2 - x1) * padding)
+            pad_h = int((y2 - y1) * padding)
+
+            x1 = max(0, x1 - pad_w)
+            y1 = max(0, y1 - pad_h)
+            x2 = min(img.shape[1], x2 + pad_w)
+            y2 = min(img.shape[0], y2 + pad_h)
+
             # Crop to face region
             cropped = img[y1:y2, x1:x2]
-            
+
             # Convert to PIL Image
             cropped_pil = Image.fromarray(cv2.cvtColor(cropped, cv2.COLOR_BGR2RGB))
-            
-            # Remove background
-            output_image = remove(cropped_pil)
-            
-            # Convert to bytes
-            output_buffer = io.BytesIO()
-            output_image.save(output_buffer, format='PNG')
-            output_bytes = output_buffer.getvalue()
-            
-            return output_bytes
-            
+
+            return self._remove_to_png(cropped_pil)
+
         except Exception as e:
             print(f"Face crop background removal error: {e}")
             # Fallback to regular background removal
             return self.remove_background(image_bytes)
+
+    def _remove_to_png(self, image):
+        output_image = self._remove(image, session=self.session)
+
+        # Convert to bytes
+        output_buffer = io.BytesIO()
+        output_image.save(output_buffer, format='PNG')
+        return output_buffer.getvalue()
+
+
+class BackgroundRemovalBusy(Exception):
+    pass
+
+
+class BackgroundRemovalPool:
+    """
+    Runs BackgroundRemover in a small pool of worker processes, each with
+    its own warmed session, so U²-Net inference never holds the GIL or the
+    event loop of the camera pipeline. Workers run at lower CPU priority
+    with a capped number of ONNX threads. At most max_pending removals are
+    queued; beyond that remove() raises BackgroundRemovalBusy unless asked to wait.
+    If a worker dies (e.g. out of memory on a huge image) the pool is
+    rebuilt and re-warmed; only the calls in flight at the time fail.
+    """
+
+    def __init__(self, model_name='u2net', workers=1, threads=1, max_pending=4):
+        self.model_name = model_name
+        self.workers = workers
+        self.threads = threads
+        self.max_pending = max_pending
+        self.executor = self._new_executor()
+        self.restarts = 0
+        self.slots = asyncio.Semaphore(max_pending)
+        self.pending = 0
+        self.processed = 0
+        self.failed = 0
+        self.ready = False
+
+    async def warm(self):
+        """Start the workers and load the model now rather than on the first request"""
+        try:
+            loop = asyncio.get_running_loop()
+            await asyncio.gather(*(loop.run_in_executor(self.executor, _ping) for _ in range(self.workers)))
+            self.ready = True
+            print(f"Background removal ready: {self.workers} worker(s), model {self.model_name}")
+        except Exception as e:
+            print(f"Background removal workers failed to start: {e}")
+
+    async def remove(self, image_bytes, face_box=None, padding=0.3, wait=False):
+        """
+        Remove the background, cropped around face_box when given.
+        Returns: PNG bytes
+        Raises: BackgroundRemovalBusy if the queue is full and wait is False
+        """
+        if not wait and self.pending >= self.max_pending:
+            raise BackgroundRemovalBusy()
+        self.pending += 1
+        try:
+            async with self.slots:
+                loop = asyncio.get_running_loop()
+                executor = self.executor
+                try:
+                    result = await loop.run_in_executor(executor, _remove, image_bytes, face_box, padding)
+                except BrokenProcessPool:
+                    self._restart(executor)
+                    raise RuntimeError("Background removal worker crashed (image too large?), please try again")
+            self.processed += 1
+            return result
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.pending -= 1
+
+    def stats(self):
+        return {
+            'model': self.model_name,
+            'workers': self.workers,
+            'ready': self.ready,
+            'pending': self.pending,
+            'processed': self.processed,
+            'failed': self.failed,
+            'restarts': self.restarts,
+        }
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def _new_executor(self):
+        # spawn: forking a process that already runs ONNX and asyncio threads is unsafe
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+            initargs=(self.model_name, self.threads)
+        )
+
+    def _restart(self, broken):
+        # Every call in flight on the broken pool lands here; only the first replaces it
+        if self.executor is not broken:
+            return
+        print("Background removal worker died, restarting the pool")
+        broken.shutdown(wait=False, cancel_futures=True)
+        self.executor = self._new_executor()
+        self.ready = False
+        self.restarts += 1
+        asyncio.ensure_future(self.warm())
+
+
+def decode_base64_image(base64_image):
+    """Bytes of a base64 image, with or without a data URI prefix"""
+    # Remove data URI prefix if present
+    if ',' in base64_image:
+        base64_image = base64_image.split(',')[1]
+    return base64.b64decode(base64_image)
+
+
+def png_data_uri(png_bytes):
+    return f"data:image/png;base64,{base64.b64encode(png_bytes).decode('utf-8')}"
+
+
+# Worker process side
+
+_remover = None
+
+
+def _init_worker(model_name, threads):
+    global _remover
+    # rembg passes OMP_NUM_THREADS on to its ONNX session options
+    os.environ['OMP_NUM_THREADS'] = str(threads)
+    try:
+        # Let the camera pipeline win any contention for the CPU
+        os.nice(10)
+    except (AttributeError, OSError):
+        pass
+    _remover = BackgroundRemover(model_name)
+    _remover.warm()
+
+
+def _ping():
+    return _remover is not None
+
+
+def _remove(image_bytes, face_box, padding):
+    return _remover.remove_background_with_face_crop(image_bytes, face_box, padding)
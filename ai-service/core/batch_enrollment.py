@@ -0,0 +1,204 @@
+import asyncio
+import base64
+import functools
+import io
+import os
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+from core import metrics
+from core.embedding_codec import encode_embedding
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+
+
+class BatchEmbedder:
+    """
+    Embeds many enrollment photos per request.
+    Images are decoded in parallel on a small thread pool, a bounded
+    window ahead of the model, and grouped into batches of up to
+    max_batch for one detector run and one ArcFace run each
+    (FaceRecognizer.largest_faces). The model runs on the executor passed
+    in, shared with single-image enrollment so enrollment never takes
+    more than one thread of model time away from the cameras.
+    embed() yields one result per image as its batch finishes. With an
+    EmbeddingCache, images seen before are answered from it during decode
+    and never reach the model.
+    """
+
+    def __init__(self, recognizer, model_executor, decode_workers=4, max_batch=16, cache=None):
+        self.recognizer = recognizer
+        self.model_executor = model_executor
+        self.max_batch = max(1, max_batch)
+        self.cache = cache
+        self.decode_executor = ThreadPoolExecutor(max_workers=decode_workers, thread_name_prefix="enroll-decode")
+
+    def close(self):
+        self.decode_executor.shutdown(wait=False)
+
+    async def embed_one(self, data, output="json"):
+        """Single image through the same path (and cache). Returns: its result dict"""
+        results = self.embed([("upload", data)], output)
+        try:
+            return await results.__anext__()
+        finally:
+            await results.aclose()
+
+    async def embed(self, items, output="json"):
+        """
+        items: list of (filename, data) where data is the image bytes, a
+            callable returning them (run on a decode thread) or an exception to report
+        output: 'json' for float lists, 'binary' for base64 of the packed float32 blob
+        Yields: result dicts in completion order, each with its item's index
+        """
+        loop = asyncio.get_running_loop()
+        queued = iter(enumerate(items))
+        decoding = set()
+        decoded = []  # [(index, filename, image, cache key)]
+        window = self.max_batch * 2
+
+        def fill():
+            while len(decoding) + len(decoded) < window:
+                try:
+                    index, (filename, data) = next(queued)
+                except StopIteration:
+                    return
+                decoding.add(loop.run_in_executor(self.decode_executor, self._decode, index, filename, data, output))
+
+        fill()
+        while decoding or decoded:
+            # Keep collecting until a batch is full or nothing else is decoding
+            if decoding and len(decoded) < self.max_batch:
+                done, _ = await asyncio.wait(decoding, return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    decoding.discard(future)
+                    index, filename, image, key, result = future.result()
+                    if result is not None:
+                        yield result
+                    else:
+                        decoded.append((index, filename, image, key))
+                fill()
+                continue
+
+            batch = decoded[:self.max_batch]
+            del decoded[:self.max_batch]
+            fill()
+            try:
+                entries = await loop.run_in_executor(self.model_executor, self._embed_batch, batch)
+            except Exception as e:
+                for index, filename, _, _ in batch:
+                    yield _failure(index, filename, f"Embedding failed: {e}")
+                continue
+
+            for (index, filename, _, _), entry in zip(batch, entries):
+                yield _result(index, filename, entry, output, cached=False)
+
+    def _embed_batch(self, batch):
+        """
+        Runs on the model executor: embeds the batch and stores the results
+        in the cache there too, so its SQLite writes stay off the event loop.
+        Returns: result entries in batch order
+        """
+        faces = self.recognizer.largest_faces([image for _, _, image, _ in batch])
+        entries = []
+        for (_, _, _, key), (face, count) in zip(batch, faces):
+            entry = {'embedding': None, 'bbox': None, 'det_score': None, 'face_count': count}
+            if face is not None:
+                entry = {
+                    'embedding': np.asarray(face.embedding, dtype=np.float32),
+                    'bbox': [float(v) for v in face.bbox[:4]],
+                    'det_score': float(face.det_score),
+                    'face_count': count,
+                }
+            if key is not None:
+                try:
+                    self.cache.put(key, **entry)
+                except Exception as e:
+                    print(f"Embedding cache write failed: {e}")
+            entries.append(entry)
+        return entries
+
+    def _decode(self, index, filename, data, output):
+        """
+        Runs on a decode thread.
+        Returns: (index, filename, image, cache key, result) where result is
+        set instead of image when the item is already answered (error or cache hit)
+        """
+        if isinstance(data, Exception):
+            return index, filename, None, None, _failure(index, filename, str(data))
+        try:
+            if callable(data):
+                data = data()
+        except Exception as e:
+            return index, filename, None, None, _failure(index, filename, f"Could not read image: {e}")
+
+        key = None
+        if self.cache is not None:
+            key = self.cache.key(data, self.recognizer.model_id)
+            entry = self.cache.get(key)
+            if entry is not None:
+                metrics.CACHE_LOOKUPS.labels('enrollment_embedding', 'hit').inc()
+                return index, filename, None, key, _result(index, filename, entry, output, cached=True)
+            metrics.CACHE_LOOKUPS.labels('enrollment_embedding', 'miss').inc()
+
+        try:
+            image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+        except cv2.error:
+            image = None
+        if image is None:
+            return index, filename, None, None, _failure(index, filename, "Could not decode image")
+        return index, filename, image, key, None
+
+
+def read_archive(data, max_images, max_image_bytes):
+    """
+    Image entries of a zip archive, in archive order, extracted lazily by
+    the decode threads. Oversized entries are reported per image.
+    Returns: list of (filename, loader or ValueError) items for BatchEmbedder.embed
+    Raises: ValueError if it is not a zip or holds more than max_images images
+    """
+    try:
+        archive = zipfile.ZipFile(io.BytesIO(data))
+    except zipfile.BadZipFile:
+        raise ValueError("archive is not a valid zip file")
+
+    entries = [
+        info for info in archive.infolist()
+        if not info.is_dir()
+        and not os.path.basename(info.filename).startswith('.')
+        and not info.filename.startswith('__MACOSX/')
+        and info.filename.lower().endswith(IMAGE_EXTENSIONS)
+    ]
+    if len(entries) > max_images:
+        raise ValueError(f"archive holds {len(entries)} images, the limit is {max_images}")
+
+    items = []
+    for info in entries:
+        if info.file_size > max_image_bytes:
+            items.append((info.filename, ValueError(f"image is larger than {max_image_bytes} bytes")))
+        else:
+            items.append((info.filename, functools.partial(archive.read, info)))
+    return items
+
+
+def _result(index, filename, entry, output, cached):
+    embedding = entry['embedding']
+    if embedding is None:
+        return _failure(index, filename, "No face detected in image")
+    return {
+        "index": index,
+        "filename": filename,
+        "success": True,
+        "embedding": base64.b64encode(encode_embedding(embedding)).decode()
+        if output == "binary" else embedding.tolist(),
+        "dimensions": len(embedding),
+        "bbox": entry['bbox'],
+        "detScore": entry['det_score'],
+        "faceCount": entry['face_count'],
+        "cached": cached,
+    }
+
+
+def _failure(index, filename, error):
+    return {"index": index, "filename": filename, "success": False, "error": error}
@@ -0,0 +1,106 @@
+class CameraSettings:
+    """Capture and detection settings for one camera"""
+
+    def __init__(self, camera_id, frame_size=(1280, 720), det_size=640, process_every_n=3):
+        self.camera_id = camera_id
+        self.frame_size = frame_size  # (width, height) frames are resized to
+        self.det_size = det_size  # Square detector input side
+        self.process_every_n = process_every_n  # Send every Nth frame to detection
+
+    @staticmethod
+    def round_det_size(size):
+        """Nearest detector input side the RetinaFace strides handle: a multiple of 32, at least 32"""
+        return max(32, int(size) // 32 * 32)
+
+    @staticmethod
+    def parse_size(value):
+        """'1280x720' -> (1280, 720)"""
+        width, height = value.lower().split('x')
+        return int(width), int(height)
+
+    def snapshot(self):
+        return {
+            'frame_size': list(self.frame_size),
+            'det_size': self.det_size,
+            'process_every_n': self.process_every_n,
+        }
+
+
+class AdaptiveController:
+    """
+    Keeps one camera's capture-to-detection latency near a target by
+    trading quality for throughput within set bounds. When the camera's
+    frames are being dropped or its recent p95 latency is over target, it
+    first processes fewer frames, then lowers the detector input size;
+    with headroom it undoes the same steps in reverse. The configured
+    settings are the ceiling: it never goes above them.
+    """
+
+    def __init__(self, settings, target_latency=0.3, min_det_size=320, max_every_n=8,
+                 interval=2.0, det_step=64):
+        self.settings = settings
+        self.target_latency = target_latency
+        self.interval = interval
+        # Every size it steps through stays a multiple of 32
+        settings.det_size = CameraSettings.round_det_size(settings.det_size)
+        self.max_det_size = settings.det_size
+        self.min_det_size = min(CameraSettings.round_det_size(min_det_size), settings.det_size)
+        self.min_every_n = settings.process_every_n
+        self.max_every_n = max(max_every_n, settings.process_every_n)
+        self.det_step = CameraSettings.round_det_size(det_step)
+        self.last_adjust = 0.0
+        self.last_dropped = None
+        self.last_processed = None
+        self.adjustments = 0
+
+    def observe(self, load, now):
+        """
+        Feed the camera's recent load (InferencePool.camera_load).
+        Returns: True if the settings changed
+        """
+        if load is None or now - self.last_adjust < self.interval:
+            return False
+        # Nothing processed since the last look (e.g. motion gated): latencies are stale
+        if load['processed'] == self.last_processed:
+            return False
+        self.last_adjust = now
+        self.last_processed = load['processed']
+
+        dropped = load['dropped'] - self.last_dropped if self.last_dropped is not None else 0
+        self.last_dropped = load['dropped']
+        latency = load['latency_p95']
+        if latency is None:
+            return False
+
+        if dropped > 0 or latency > self.target_latency * 1.2:
+            changed = self._degrade()
+        elif latency < self.target_latency * 0.6 and load['queue_depth'] == 0:
+            changed = self._upgrade()
+        else:
+            changed = False
+
+        if changed:
+            self.adjustments += 1
+            print(f"Camera {self.settings.camera_id}: p95 {latency * 1000:.0f}ms, {dropped} dropped -> "
+                  f"det_size {self.settings.det_size}, every {self.settings.process_every_n} frames")
+        return changed
+
+    def _degrade(self):
+        settings = self.settings
+        if settings.process_every_n < self.max_every_n:
+            settings.process_every_n += 1
+            return True
+        if settings.det_size > self.min_det_size:
+            settings.det_size = max(self.min_det_size, settings.det_size - self.det_step)
+            return True
+        return False
+
+    def _upgrade(self):
+        settings = self.settings
+        if settings.det_size < self.max_det_size:
+            settings.det_size = min(self.max_det_size, settings.det_size + self.det_step)
+            return True
+        if settings.process_every_n > self.min_every_n:
+            settings.process_every_n -= 1
+            return True
+        return False
@@ -0,0 +1,156 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+from core.embedding_codec import encode_embedding, decode_embedding
+
+
+class EmbeddingCache:
+    """
+    Enrollment results keyed by a hash of the image bytes and the model
+    that produced them, so re-submitted photos (retries, re-validation,
+    duplicate uploads) skip detection and ArcFace entirely.
+    An in-memory LRU of max_entries, with an optional SQLite tier at
+    `path` (up to disk_entries rows) that survives restarts. Entries expire
+    after `ttl` seconds in both tiers. "No face" results are cached too.
+    Thread-safe; every lookup is a dict access or one indexed SQLite read.
+    """
+
+    def __init__(self, max_entries=1000, ttl=86400, path=None, disk_entries=20000):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self.disk_entries = disk_entries
+        self.entries = OrderedDict()  # { key: (entry, expires_at) }
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = None
+        self._writes = 0
+        if path:
+            self._open()
+
+    @staticmethod
+    def key(data, model_id):
+        return hashlib.blake2b(data, digest_size=20, person=b'labface-enroll').hexdigest() + ':' + model_id
+
+    def get(self, key):
+        """
+        Returns: the cached entry (dict with embedding, bbox, det_score, face_count), or None on a miss
+        """
+        now = time.time()
+        with self._lock:
+            cached = self.entries.get(key)
+            if cached is not None:
+                if cached[1] > now:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return cached[0]
+                del self.entries[key]
+
+            entry = self._disk_get(key, now) if self._conn is not None else None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._remember(key, entry, now)
+            return entry
+
+    def put(self, key, embedding, bbox=None, det_score=None, face_count=0):
+        entry = {
+            'embedding': None if embedding is None else np.asarray(embedding, dtype=np.float32),
+            'bbox': bbox,
+            'det_score': det_score,
+            'face_count': face_count,
+        }
+        now = time.time()
+        with self._lock:
+            self._remember(key, entry, now)
+            if self._conn is not None:
+                self._disk_put(key, entry, now)
+        return entry
+
+    def stats(self):
+        lookups = self.hits + self.disk_hits + self.misses
+        disk = None
+        if self._conn is not None:
+            with self._lock:
+                disk = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        return {
+            'entries': len(self.entries),
+            'disk_entries': disk,
+            'hits': self.hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': (self.hits + self.disk_hits) / lookups if lookups else None,
+        }
+
+    def close(self):
+        if self._conn is not None:
+            with self._lock:
+                self._conn.close()
+                self._conn = None
+
+    def _remember(self, key, entry, now):
+        self.entries[key] = (entry, now + self.ttl)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def _open(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "cache_key TEXT PRIMARY KEY, embedding BLOB, meta TEXT NOT NULL, "
+            "created_at REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self._conn.execute("DELETE FROM embeddings WHERE created_at < ?", (time.time() - self.ttl,))
+        self._conn.commit()
+
+    def _disk_get(self, key, now):
+        row = self._conn.execute(
+            "SELECT embedding, meta, created_at FROM embeddings WHERE cache_key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        embedding, meta, created_at = row
+        if created_at + self.ttl <= now:
+            self._conn.execute("DELETE FROM embeddings WHERE cache_key = ?", (key,))
+            self._conn.commit()
+            return None
+        self._conn.execute("UPDATE embeddings SET last_used = ? WHERE cache_key = ?", (now, key))
+        self._conn.commit()
+        entry = json.loads(meta)
+        entry['embedding'] = decode_embedding(embedding) if embedding is not None else None
+        return entry
+
+    def _disk_put(self, key, entry, now):
+        embedding = entry['embedding']
+        meta = {k: v for k, v in entry.items() if k != 'embedding'}
+        self._conn.execute(
+            "INSERT OR REPLACE INTO embeddings (cache_key, embedding, meta, created_at, last_used) VALUES (?, ?, ?, ?, ?)",
+            (key, None if embedding is None else sqlite3.Binary(encode_embedding(embedding)), json.dumps(meta), now, now)
+        )
+        self._writes += 1
+        # Trim the least recently used rows now and then rather than on every write
+        if self._writes % 100 == 0:
+            self._conn.execute(
+                "DELETE FROM embeddings WHERE cache_key IN ("
+                "SELECT cache_key FROM embeddings ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.disk_entries,)
+            )
+        self._conn.commit()
@@ -0,0 +1,47 @@
+import json
+import struct
+import numpy as np
+
+# Binary layout: 8-byte header followed by little-endian float32 values
+#   magic (4s) | version (B) | dtype (B) | dim (H)
+MAGIC = b'LFE1'
+VERSION = 1
+DTYPE_FLOAT32 = 1
+HEADER = struct.Struct('<4sBBH')
+
+
+def encode_embedding(embedding):
+    """
+    Pack an embedding into the binary storage format.
+    Returns: bytes (8-byte header + dim * 4 bytes)
+    """
+    vector = np.asarray(embedding, dtype='<f4').ravel()
+    return HEADER.pack(MAGIC, VERSION, DTYPE_FLOAT32, len(vector)) + vector.tobytes()
+
+
+def is_binary_embedding(raw):
+    return isinstance(raw, (bytes, bytearray, memoryview)) and bytes(raw[:4]) == MAGIC
+
+
+def decode_embedding(raw):
+    """
+    Dual-read decoder for users.face_embedding.
+    Accepts the binary format (read zero-copy with np.frombuffer) or the
+    legacy JSON text array, as str or bytes.
+    Returns: float32 vector, or None if raw is empty or malformed
+    """
+    if raw is None or len(raw) == 0:
+        return None
+
+    if is_binary_embedding(raw):
+        if len(raw) < HEADER.size:
+            return None
+        _, version, dtype, dim = HEADER.unpack_from(raw)
+        if version != VERSION or dtype != DTYPE_FLOAT32 or len(raw) != HEADER.size + dim * 4:
+            return None
+        return np.frombuffer(raw, dtype='<f4', count=dim, offset=HEADER.size)
+
+    try:
+        return np.asarray(json.loads(raw), dtype=np.float32)
+    except (ValueError, TypeError):
+        return None
@@ -0,0 +1,68 @@
+import asyncio
+import json
+from core.embedding_codec import encode_embedding
+
+BLOB_TYPES = ('blob', 'mediumblob', 'longblob', 'varbinary')
+
+
+async def convert_json_embeddings(db_pool, batch_size=200, pause=0.5):
+    """
+    Background converter: rewrite legacy JSON users.face_embedding rows into
+    the binary float32 format, one batch at a time.
+    Only runs once the column has been migrated to a BLOB type
+    (backend/convert_face_embedding_blob.js).
+    Returns: number of rows converted
+    """
+    async with db_pool.acquire() as conn:
+        async with conn.cursor() as cursor:
+            await cursor.execute(
+                "SELECT COLUMN_NAME, DATA_TYPE FROM information_schema.COLUMNS "
+                "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'users' "
+                "AND COLUMN_NAME IN ('face_embedding', 'updated_at')"
+            )
+            columns = {name: data_type.lower() for name, data_type in await cursor.fetchall()}
+
+    if columns.get('face_embedding') not in BLOB_TYPES:
+        print("users.face_embedding is not a BLOB column, skipping binary embedding conversion")
+        return 0
+
+    # Keep updated_at so the gallery does not treat the rewrite as a change
+    keep_marker = ", updated_at = updated_at" if 'updated_at' in columns else ""
+
+    converted = 0
+    last_id = 0
+    while True:
+        async with db_pool.acquire() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(
+                    "SELECT id, face_embedding FROM users "
+                    "WHERE id > %s AND face_embedding LIKE '[%%' "
+                    "ORDER BY id LIMIT %s",
+                    (last_id, batch_size)
+                )
+                rows = await cursor.fetchall()
+                if not rows:
+                    break
+                last_id = rows[-1][0]
+
+                updates = []
+                for user_id, raw in rows:
+                    try:
+                        updates.append((encode_embedding(json.loads(raw)), user_id, raw))
+                    except (ValueError, TypeError):
+                        print(f"Skipping malformed embedding for user {user_id}")
+
+                if updates:
+                    # Guard on the old value so a concurrent re-enrollment is not overwritten
+                    await cursor.executemany(
+                        f"UPDATE users SET face_embedding = %s{keep_marker} "
+                        "WHERE id = %s AND face_embedding = %s",
+                        updates
+                    )
+                    converted += cursor.rowcount
+
+        await asyncio.sleep(pause)
+
+    if converted:
+        print(f"Converted {converted} face embeddings to binary format")
+    return converted
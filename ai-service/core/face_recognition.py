@@ -1,33 +1,247 @@
+import os
 import cv2
 import numpy as np
-import insightface
+import onnxruntime
 from insightface.app import FaceAnalysis
+from insightface.app.common import Face
+from insightface.model_zoo.retinaface import distance2bbox, distance2kps
+from insightface.utils import face_align
+
+# Upper bound on face crops per ArcFace run
+REC_BATCH_SIZE = 32
 
 class FaceRecognizer:
-    def __init__(self):
+    def __init__(self, threads=None, det_size=(640, 640), allowed_modules=None):
         # Initialize InsightFace
         # providers=['CUDAExecutionProvider'] if GPU available, else ['CPUExecutionProvider']
-        self.app = FaceAnalysis(name='buffalo_l', providers=['CPUExecutionProvider'])
-        self.app.prepare(ctx_id=0, det_size=(640, 640))
+        # allowed_modules: subset of the pack to load, e.g. ['detection', 'recognition']; None loads all
+        self.app = FaceAnalysis(name='buffalo_l', providers=['CPUExecutionProvider'],
+                                allowed_modules=allowed_modules)
+        if threads:
+            self._limit_threads(threads)
+        # Default detector input; detect_faces can override it per frame
+        self.app.prepare(ctx_id=0, det_size=tuple(det_size))
+
+        self.det_model = self.app.det_model
+        self.rec_model = self.app.models.get('recognition')
+        # Batched runs need a dynamic batch dimension in the exported graph
+        self.det_batching = _has_dynamic_batch(self.det_model.session)
+        self.rec_batching = self.rec_model is not None and _has_dynamic_batch(self.rec_model.session)
+        # Identifies what produced an embedding, e.g. for cache keys
+        det_file = os.path.basename(self.det_model.model_file)
+        rec_file = os.path.basename(self.rec_model.model_file) if self.rec_model is not None else 'none'
+        self.model_id = f"{det_file}@{det_size[0]}x{det_size[1]}+{rec_file}"
+
+    def warmup(self):
+        """
+        One detector and one ArcFace run on blank input, so ONNX Runtime has
+        allocated its buffers before the first real frame arrives.
+        """
+        width, height = self.det_model.input_size
+        self.det_model.detect(np.zeros((height, width, 3), dtype=np.uint8), input_size=(width, height))
+        if self.rec_model is not None:
+            size = self.rec_model.input_size[0]
+            self.embed_crops([np.zeros((size, size, 3), dtype=np.uint8)])
+
+    def _limit_threads(self, threads):
+        # Cap ONNX intra-op threads when several recognizers share the CPU.
+        # FaceAnalysis does not forward session options, so re-create the sessions
+        # from the model files insightface loaded them from.
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = threads
+        for model in self.app.models.values():
+            model.session = onnxruntime.InferenceSession(
+                model.model_file,
+                sess_options=options,
+                providers=model.session.get_providers()
+            )
 
     def get_embedding(self, image_bytes):
         # Convert bytes to numpy array
         nparr = np.frombuffer(image_bytes, np.uint8)
         img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        
+
         faces = self.app.get(img)
         if not faces:
             return None
-        
+
         # Return the embedding of the largest face found
-        # Sort by bounding box area
-        faces = sorted(faces, key=lambda x: (x.bbox[2]-x.bbox[0]) * (x.bbox[3]-x.bbox[1]), reverse=True)
-        return faces[0].embedding.tolist()
-
-    def compare_faces(self, known_embedding, new_embedding):
-        # Cosine Similarity
-        # Compute cosine similarity between two vectors
-        vec1 = np.array(known_embedding)
-        vec2 = np.array(new_embedding)
-        sim = np.dot(vec1, vec2) / (np.linalg.norm(vec1) * np.linalg.norm(vec2))
-        return sim
+        return max(faces, key=_area).embedding.tolist()
+
+    def analyze_batch(self, frames):
+        """
+        Detection + ArcFace embedding for several frames in as few ONNX runs
+        as the models allow. Only what the pipeline uses is filled in:
+        bbox, kps, det_score and embedding (no landmarks or gender/age).
+        Returns: list (per frame) of insightface Face objects
+        """
+        if self.rec_model is None or not self.det_model.use_kps:
+            return [self.app.get(frame) for frame in frames]
+
+        faces_per_frame = self.detect_faces(frames)
+        self.embed_faces([(frame, face) for frame, faces in zip(frames, faces_per_frame) for face in faces])
+        return faces_per_frame
+
+    def largest_faces(self, images):
+        """
+        Enrollment: the largest face of each image, embedded, with all
+        images detected and embedded in batched runs.
+        Returns: list (per image) of (Face or None, number of faces found)
+        """
+        if self.rec_model is None or not self.det_model.use_kps:
+            faces_per_image = [self.app.get(image) for image in images]
+        else:
+            faces_per_image = self.detect_faces(images)
+
+        picked = [max(faces, key=_area) if faces else None for faces in faces_per_image]
+        pending = [(image, face) for image, face in zip(images, picked) if face is not None and face.embedding is None]
+        if pending:
+            self.embed_faces(pending)
+        return [(face, len(faces)) for face, faces in zip(picked, faces_per_image)]
+
+    def detect_faces(self, frames, det_sizes=None):
+        """
+        Detection only.
+        det_sizes: optional detector input (width, height) per frame, None for the default
+        Returns: list (per frame) of Face objects with bbox, kps and det_score
+        """
+        faces_per_frame = []
+        for bboxes, kpss in self.detect_batch(frames, det_sizes):
+            faces_per_frame.append([
+                Face(bbox=bboxes[i, 0:4], kps=kpss[i], det_score=bboxes[i, 4])
+                for i in range(bboxes.shape[0])
+            ])
+        return faces_per_frame
+
+    def embed_faces(self, pairs):
+        """
+        Fill in face.embedding for (frame, face) pairs with one batched ArcFace pass.
+        """
+        crops = [face_align.norm_crop(frame, landmark=face.kps, image_size=self.rec_model.input_size[0])
+                 for frame, face in pairs]
+        embeddings = self.embed_crops(crops)
+        for (_, face), embedding in zip(pairs, embeddings):
+            face.embedding = embedding
+
+    def detect_batch(self, frames, det_sizes=None):
+        """
+        Run the detector over several frames, one ONNX run per input size when possible.
+        Returns: list (per frame) of (bboxes with score column, kpss)
+        """
+        det = self.det_model
+        groups = {}
+        for i, size in enumerate(det_sizes or [None] * len(frames)):
+            groups.setdefault(tuple(size) if size else tuple(det.input_size), []).append(i)
+
+        results = [None] * len(frames)
+        for input_size, indices in groups.items():
+            if not self.det_batching or len(indices) == 1:
+                for i in indices:
+                    results[i] = det.detect(frames[i], input_size=input_size)
+                continue
+
+            det_imgs = []
+            scales = []
+            for i in indices:
+                det_img, det_scale = _letterbox(frames[i], input_size)
+                det_imgs.append(det_img)
+                scales.append(det_scale)
+
+            blob = cv2.dnn.blobFromImages(det_imgs, 1.0 / det.input_std, input_size,
+                                          (det.input_mean, det.input_mean, det.input_mean), swapRB=True)
+            net_outs = det.session.run(det.output_names, {det.input_name: blob})
+            for b, (i, scale) in enumerate(zip(indices, scales)):
+                results[i] = self._decode_detections(net_outs, b, len(indices), input_size, scale)
+        return results
+
+    def embed_crops(self, crops):
+        """
+        ArcFace embeddings for aligned 112x112 face crops, batched.
+        Returns: (n, dim) float32 array
+        """
+        if not crops:
+            return np.zeros((0, 512), dtype=np.float32)
+
+        batch_size = REC_BATCH_SIZE if self.rec_batching else 1
+        chunks = [self.rec_model.get_feat(crops[i:i + batch_size])
+                  for i in range(0, len(crops), batch_size)]
+        return np.vstack(chunks).astype(np.float32, copy=False)
+
+    def _decode_detections(self, net_outs, b, batch, input_size, det_scale):
+        # Mirrors RetinaFace.forward/detect in insightface for image b of a batch
+        det = self.det_model
+        input_width, input_height = input_size
+        scores_list = []
+        bboxes_list = []
+        kpss_list = []
+
+        for idx, stride in enumerate(det._feat_stride_fpn):
+            scores = _take(net_outs[idx], b, batch)
+            bbox_preds = _take(net_outs[idx + det.fmc], b, batch) * stride
+            anchor_centers = self._anchor_centers(input_height // stride, input_width // stride, stride)
+
+            pos_inds = np.where(scores >= det.det_thresh)[0]
+            bboxes = distance2bbox(anchor_centers, bbox_preds)
+            scores_list.append(scores[pos_inds])
+            bboxes_list.append(bboxes[pos_inds])
+
+            kps_preds = _take(net_outs[idx + det.fmc * 2], b, batch) * stride
+            kpss = distance2kps(anchor_centers, kps_preds)
+            kpss = kpss.reshape((kpss.shape[0], -1, 2))
+            kpss_list.append(kpss[pos_inds])
+
+        scores = np.vstack(scores_list)
+        order = scores.ravel().argsort()[::-1]
+        bboxes = np.vstack(bboxes_list) / det_scale
+        kpss = np.vstack(kpss_list) / det_scale
+
+        pre_det = np.hstack((bboxes, scores)).astype(np.float32, copy=False)
+        pre_det = pre_det[order, :]
+        keep = det.nms(pre_det)
+        return pre_det[keep, :], kpss[order, :, :][keep, :, :]
+
+    def _anchor_centers(self, height, width, stride):
+        det = self.det_model
+        key = (height, width, stride)
+        if key in det.center_cache:
+            return det.center_cache[key]
+
+        anchor_centers = np.stack(np.mgrid[:height, :width][::-1], axis=-1).astype(np.float32)
+        anchor_centers = (anchor_centers * stride).reshape((-1, 2))
+        if det._num_anchors > 1:
+            anchor_centers = np.stack([anchor_centers] * det._num_anchors, axis=1).reshape((-1, 2))
+        if len(det.center_cache) < 100:
+            det.center_cache[key] = anchor_centers
+        return anchor_centers
+
+
+def _has_dynamic_batch(session):
+    return not isinstance(session.get_inputs()[0].shape[0], int)
+
+
+def _take(output, b, batch):
+    """Rows for image b of a detector output, with or without a batch axis"""
+    if output.ndim == 3:
+        return output[b]
+    return output.reshape(batch, -1, output.shape[-1])[b]
+
+
+def _letterbox(img, input_size):
+    """Resize keeping aspect ratio and pad to the detector input, as RetinaFace.detect does"""
+    im_ratio = float(img.shape[0]) / img.shape[1]
+    model_ratio = float(input_size[1]) / input_size[0]
+    if im_ratio > model_ratio:
+        new_height = input_size[1]
+        new_width = int(new_height / im_ratio)
+    else:
+        new_width = input_size[0]
+        new_height = int(new_width * im_ratio)
+    det_scale = float(new_height) / img.shape[0]
+    resized_img = cv2.resize(img, (new_width, new_height))
+    det_img = np.zeros((input_size[1], input_size[0], 3), dtype=np.uint8)
+    det_img[:new_height, :new_width, :] = resized_img
+    return det_img, det_scale
+
+
+def _area(face):
+    return (face.bbox[2] - face.bbox[0]) * (face.bbox[3] - face.bbox[1])
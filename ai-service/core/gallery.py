@@ -0,0 +1,136 @@
+import numpy as np
+from core.ann_index import BruteForceIndex, normalize
+from core.embedding_codec import decode_embedding
+
+# Row columns that are bookkeeping for the refresh, not student info
+_INTERNAL_COLUMNS = ('face_embedding', 'updated_at', 'role')
+
+
+class EmbeddingGallery:
+    """
+    In-memory gallery of enrolled face embeddings.
+    Embeddings are parsed once at load time, L2-normalized to float32 and
+    stored in a search index (exact brute force by default, see
+    core.ann_index), so scoring every face in a frame against every student
+    is one batched call.
+    """
+
+    def __init__(self, dim=512, index=None):
+        self.dim = dim
+        # Indexes define __len__, so an empty one is falsy: compare with None
+        self.index = index if index is not None else BruteForceIndex(dim)
+        self.students = {}  # { id: row without face_embedding }
+        self.version = 0  # Bumped on every change so derived galleries know to rebuild
+
+    def __len__(self):
+        return len(self.index)
+
+    def load(self, rows):
+        """
+        Rebuild the gallery from database rows.
+        rows: iterable of dicts with 'id' and 'face_embedding' (binary or JSON text)
+        Returns: number of students loaded
+        """
+        vectors = {}
+        students = {}
+
+        for row in rows:
+            vector = self._parse_embedding(row.get('face_embedding'))
+            if vector is None:
+                continue
+            sid = int(row['id'])
+            vectors[sid] = vector
+            students[sid] = self.student_info(row)
+
+        if vectors:
+            self.index.build(list(vectors), normalize(np.vstack(list(vectors.values()))))
+        else:
+            self.index.build([], np.zeros((0, self.dim), dtype=np.float32))
+        self.students = students
+        self.version += 1
+        return len(students)
+
+    def update(self, rows=(), removed_ids=()):
+        """
+        Apply a delta on top of the current gallery.
+        Rows whose face_embedding is empty are treated as removals.
+        rows: changed rows (same shape as load)
+        removed_ids: ids to drop from the gallery
+        Returns: (upserted, removed) counts
+        """
+        drop = {int(sid) for sid in removed_ids}
+        upserts = {}
+        infos = {}
+
+        for row in rows:
+            sid = int(row['id'])
+            vector = self._parse_embedding(row.get('face_embedding'))
+            if vector is None:
+                drop.add(sid)
+                upserts.pop(sid, None)
+                continue
+            drop.discard(sid)
+            upserts[sid] = vector
+            infos[sid] = self.student_info(row)
+
+        drop &= self.students.keys()
+        if not upserts and not drop:
+            return 0, 0
+
+        students = dict(self.students)
+        students.update(infos)
+        for sid in drop:
+            students.pop(sid, None)
+
+        # Each index applies its update as one swap; students follow right after
+        vectors = normalize(np.vstack(list(upserts.values()))) if upserts else None
+        self.index.update(list(upserts), vectors, drop)
+        self.students = students
+        self.version += 1
+        return len(upserts), len(drop)
+
+    def subset(self, ids):
+        """
+        Exact-search gallery over just the given student ids.
+        Used to restrict matching to a small candidate set.
+        """
+        found, vectors = self.index.vectors_for(ids)
+        subset = EmbeddingGallery(self.dim)
+        subset.index.build(found, vectors)
+        subset.students = {sid: self.students[sid] for sid in found.tolist() if sid in self.students}
+        return subset
+
+    def search(self, queries, top_k=1):
+        """
+        Score every query embedding against the gallery.
+        queries: (n, dim) array or list of embeddings
+        Returns: (ids, scores), both shaped (n, k) and sorted by descending score
+        """
+        queries = normalize(np.asarray(queries, dtype=np.float32).reshape(-1, self.dim))
+        return self.index.search(queries, top_k)
+
+    def best_matches(self, queries, threshold):
+        """
+        Top-1 match per query embedding.
+        Returns: list of (student, score) where student is None below threshold
+        """
+        ids, scores = self.search(queries, top_k=1)
+        students = self.students
+
+        matches = []
+        for row_ids, row_scores in zip(ids, scores):
+            if len(row_ids) and row_scores[0] > threshold:
+                matches.append((students.get(int(row_ids[0])), float(row_scores[0])))
+            else:
+                matches.append((None, float(row_scores[0]) if len(row_scores) else 0.0))
+        return matches
+
+    @staticmethod
+    def student_info(row):
+        return {k: v for k, v in row.items() if k not in _INTERNAL_COLUMNS}
+
+    def _parse_embedding(self, raw):
+        vector = decode_embedding(raw)
+        if vector is None or vector.shape != (self.dim,):
+            return None
+        return vector
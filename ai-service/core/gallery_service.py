@@ -0,0 +1,254 @@
+import asyncio
+import hashlib
+import json
+import os
+from datetime import datetime
+import aiomysql
+from core.gallery import EmbeddingGallery
+
+STUDENT_COLUMNS = "id, student_id, first_name, last_name, face_embedding"
+# Ids per query when reconcile re-reads students missing from the gallery
+RECONCILE_FETCH_CHUNK = 500
+
+
+class GalleryService:
+    """
+    Process-wide embedding gallery shared by every camera task.
+    Does one full load, then delta refreshes keyed on users.updated_at so the
+    refresh cost scales with the number of changed students, not enrolled ones.
+    The backend can also ping POST /gallery/refresh to pull changes immediately.
+    With index_path set, the index is persisted so a restart only needs a
+    delta from the saved marker instead of a full load.
+    """
+
+    def __init__(self, db_pool, refresh_interval=10, reconcile_interval=300, index=None, index_path=None):
+        self.db_pool = db_pool
+        self.gallery = EmbeddingGallery(index=index)
+        self.index_path = index_path
+        self.refresh_interval = refresh_interval
+        self.reconcile_interval = reconcile_interval
+        self.marker = None  # Highest users.updated_at seen so far
+        self._marker_ids = {}  # { id: row digest } applied at exactly that timestamp
+        self.supports_delta = True
+        self.loaded = False
+        self.loaded_event = asyncio.Event()  # Set once the first load or restore is done
+        self._last_reconcile = 0
+        self._dirty = False
+        self._wake = asyncio.Event()
+        self._lock = asyncio.Lock()
+
+    async def load(self):
+        """Full load of every student with an embedding"""
+        async with self._lock:
+            rows = await self._fetch_all()
+            count = self.gallery.load(rows)
+            self.marker = None
+            self._advance_marker(rows)
+            self.loaded = True
+            self.loaded_event.set()
+            self._last_reconcile = asyncio.get_event_loop().time()
+            print(f"Gallery loaded: {count} students")
+            self._dirty = True
+            await self._persist()
+            return count
+
+    async def refresh(self):
+        """Pull rows changed since the last marker and apply them as a delta"""
+        if not self.loaded and not await self._restore():
+            return await self.load()
+
+        now = asyncio.get_event_loop().time()
+        if not self.supports_delta:
+            # No change marker column: fall back to periodic full reloads
+            if now - self._last_reconcile > self.reconcile_interval:
+                await self.load()
+            return
+
+        async with self._lock:
+            rows = [
+                row for row in await self._fetch_changed()
+                # Same second as the marker: skip only rows identical to what was applied,
+                # so a second update within that second still comes through
+                if not (row['updated_at'] == self.marker and self._marker_ids.get(row['id']) == _row_digest(row))
+            ]
+            upserts = [row for row in rows if row['role'] == 'student']
+            removed = [row['id'] for row in rows if row['role'] != 'student']
+            self._advance_marker(rows)
+
+            upserted, dropped = self.gallery.update(upserts, removed)
+            if upserted or dropped:
+                self._dirty = True
+                print(f"Gallery delta: {upserted} upserted, {dropped} removed ({len(self.gallery)} total)")
+
+            if now - self._last_reconcile > self.reconcile_interval:
+                self._last_reconcile = now
+                await self._reconcile()
+                await self._persist()
+
+    def request_refresh(self, removed_ids=()):
+        """Drop ids right away and wake the refresh loop for a delta pull"""
+        if removed_ids:
+            self.gallery.update(removed_ids=removed_ids)
+        self._wake.set()
+
+    async def run(self):
+        """Background loop: refresh on interval or when pinged"""
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                print(f"Gallery refresh error: {e}")
+
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.refresh_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    def _advance_marker(self, rows):
+        for row in rows:
+            updated_at = row.get('updated_at')
+            if updated_at is None:
+                continue
+            if self.marker is None or updated_at > self.marker:
+                self.marker = updated_at
+                self._marker_ids = {row['id']: _row_digest(row)}
+            elif updated_at == self.marker:
+                self._marker_ids[row['id']] = _row_digest(row)
+
+    async def _reconcile(self):
+        """
+        Catch hard-deleted users, which never show up in an updated_at delta,
+        and students missing from the gallery (dropped by a /gallery/refresh
+        ping or a delta that failed) whose rows have not changed since.
+        Only compares counts unless they disagree.
+        """
+        async with self.db_pool.acquire() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(
+                    "SELECT COUNT(*) FROM users "
+                    "WHERE role = 'student' AND face_embedding IS NOT NULL"
+                )
+                (count,) = await cursor.fetchone()
+                if count == len(self.gallery):
+                    return
+
+                await cursor.execute(
+                    "SELECT id FROM users WHERE role = 'student' AND face_embedding IS NOT NULL"
+                )
+                live_ids = {row[0] for row in await cursor.fetchall()}
+
+            missing = sorted(live_ids - self.gallery.students.keys())
+            rows = []
+            async with conn.cursor(aiomysql.DictCursor) as cursor:
+                for start in range(0, len(missing), RECONCILE_FETCH_CHUNK):
+                    chunk = missing[start:start + RECONCILE_FETCH_CHUNK]
+                    placeholders = ", ".join(["%s"] * len(chunk))
+                    await cursor.execute(
+                        f"SELECT {STUDENT_COLUMNS} FROM users "
+                        f"WHERE id IN ({placeholders}) AND role = 'student' AND face_embedding IS NOT NULL",
+                        chunk
+                    )
+                    rows.extend(await cursor.fetchall())
+
+        stale = [sid for sid in self.gallery.students if sid not in live_ids]
+        upserted, dropped = self.gallery.update(rows, stale)
+        if upserted or dropped:
+            self._dirty = True
+            print(f"Gallery reconcile: restored {upserted} missing students, removed {dropped} deleted students")
+
+    async def _persist(self):
+        """Save index, students and marker so a restart can resume from a delta"""
+        if not self.index_path or not self._dirty:
+            return
+        self._dirty = False
+        state = {
+            'index': self.gallery.index.kind,
+            'marker': self.marker.isoformat() if self.marker else None,
+            'marker_ids': self._marker_ids,
+            'students': {str(sid): info for sid, info in self.gallery.students.items()},
+        }
+        loop = asyncio.get_event_loop()
+        try:
+            await loop.run_in_executor(None, self._write_state, state)
+        except Exception as e:
+            print(f"Gallery persist error: {e}")
+
+    def _write_state(self, state):
+        os.makedirs(self.index_path, exist_ok=True)
+        self.gallery.index.save(self.index_path)
+        tmp_path = os.path.join(self.index_path, 'gallery.json.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f, default=str)
+        os.replace(tmp_path, os.path.join(self.index_path, 'gallery.json'))
+
+    async def _restore(self):
+        """Load persisted state; the next refresh pulls what changed since"""
+        if not self.index_path or not self.supports_delta:
+            return False
+        state_path = os.path.join(self.index_path, 'gallery.json')
+        if not os.path.exists(state_path):
+            return False
+
+        try:
+            with open(state_path) as f:
+                state = json.load(f)
+            if state['index'] != self.gallery.index.kind or not state['marker']:
+                return False
+            loop = asyncio.get_event_loop()
+            if not await loop.run_in_executor(None, self.gallery.index.load, self.index_path):
+                return False
+        except Exception as e:
+            print(f"Gallery restore error: {e}")
+            return False
+
+        self.gallery.students = {int(sid): info for sid, info in state['students'].items()}
+        self.gallery.version += 1
+        self.marker = datetime.fromisoformat(state['marker'])
+        # Older state files kept a plain id list: re-apply those rows once
+        marker_ids = state['marker_ids']
+        self._marker_ids = {int(sid): digest for sid, digest in marker_ids.items()} if isinstance(marker_ids, dict) else {}
+        self.loaded = True
+        self.loaded_event.set()
+        self._last_reconcile = 0  # Reconcile on the first refresh to catch deletes while down
+        print(f"Gallery restored from {self.index_path}: {len(self.gallery)} students")
+        return True
+
+    async def _fetch_all(self):
+        async with self.db_pool.acquire() as conn:
+            async with conn.cursor(aiomysql.DictCursor) as cursor:
+                try:
+                    await cursor.execute(
+                        f"SELECT {STUDENT_COLUMNS}, updated_at FROM users "
+                        "WHERE role = 'student' AND face_embedding IS NOT NULL"
+                    )
+                except aiomysql.OperationalError as e:
+                    # 1054: unknown column, users.updated_at migration not applied yet
+                    if e.args[0] != 1054:
+                        raise
+                    if self.supports_delta:
+                        print("users.updated_at missing, falling back to full gallery reloads")
+                    self.supports_delta = False
+                    await cursor.execute(
+                        f"SELECT {STUDENT_COLUMNS} FROM users "
+                        "WHERE role = 'student' AND face_embedding IS NOT NULL"
+                    )
+                return await cursor.fetchall()
+
+    async def _fetch_changed(self):
+        async with self.db_pool.acquire() as conn:
+            async with conn.cursor(aiomysql.DictCursor) as cursor:
+                # >= so rows written in the same second as the marker are not missed;
+                # refresh() filters out the ones already applied
+                await cursor.execute(
+                    f"SELECT {STUDENT_COLUMNS}, role, updated_at FROM users "
+                    "WHERE updated_at >= %s",
+                    (self.marker or datetime(1970, 1, 1),)
+                )
+                return await cursor.fetchall()
+
+
+def _row_digest(row):
+    """Content of a users row apart from timestamp and role, to tell a re-read from a new update"""
+    content = repr(sorted((k, v) for k, v in row.items() if k not in ('updated_at', 'role')))
+    return hashlib.blake2b(content.encode(), digest_size=16).hexdigest()
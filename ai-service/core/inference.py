@@ -0,0 +1,360 @@
+import os
+import threading
+import time
+from collections import deque
+import numpy as np
+from core import metrics
+
+
+class InferenceResult:
+    """Detections for one frame, handed back to the event loop"""
+
+    def __init__(self, camera_id, seq, frame, faces, captured_at, tracks=None):
+        self.camera_id = camera_id
+        self.seq = seq
+        self.frame = frame
+        self.faces = faces
+        # Track per face when tracking is on; faces reusing a track's identity have no embedding
+        self.tracks = tracks
+        self.captured_at = captured_at
+        self.finished_at = time.time()
+
+    @property
+    def latency(self):
+        """Seconds from frame capture to inference done"""
+        return self.finished_at - self.captured_at
+
+
+class CameraQueueStats:
+    def __init__(self, window=200):
+        self.submitted = 0
+        self.processed = 0
+        self.dropped = 0
+        self.errors = 0
+        self.recognized = 0  # Faces embedded and matched
+        self.reused = 0  # Faces that reused their track's identity
+        self.latencies = deque(maxlen=window)
+
+
+class InferencePool:
+    """
+    Dedicated inference stage: N worker threads, each owning its own
+    FaceRecognizer, fed by per-camera bounded queues. When a camera's queue
+    is full the oldest frame is dropped, so under load we skip stale frames
+    instead of falling further behind. Results are delivered to the event
+    loop through the callback given to submit().
+
+    Each worker takes up to max_batch frames across cameras, waiting at most
+    max_wait_ms for the batch to fill, and runs detection and ArcFace on
+    them together (see FaceRecognizer.detect_faces / embed_faces).
+
+    With a tracker_factory, every camera gets a FaceTracker and only faces on
+    new or re-verification-due tracks are embedded. Cameras with a region of
+    interest (set_roi) are detected on the cropped zone only, at the camera's
+    detector input size (set_det_size).
+    """
+
+    def __init__(self, recognizer_factory, num_workers=0, queue_size=2, max_batch=4, max_wait_ms=10,
+                 tracker_factory=None):
+        cpus = os.cpu_count() or 1
+        self.num_workers = num_workers or max(1, min(4, cpus // 2))
+        # Split cores between workers so ONNX sessions do not oversubscribe
+        self.threads_per_worker = max(1, cpus // self.num_workers)
+        self.recognizer_factory = recognizer_factory
+        self.queue_size = queue_size
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max_wait_ms / 1000.0
+        self.batches = 0
+        self.batched_frames = 0
+        self.queues = {}  # { camera_id: deque of (seq, frame, captured_at, callback) }
+        self.stats = {}  # { camera_id: CameraQueueStats }
+        self.tracker_factory = tracker_factory
+        self.trackers = {}  # { camera_id: FaceTracker }
+        self.rois = {}  # { camera_id: RegionOfInterest }
+        self.det_sizes = {}  # { camera_id: detector input (width, height) }
+        self.workers = []
+        self.ready_workers = 0
+        self.failed_workers = 0
+        self.load_seconds = []  # Model load + warmup time of each ready worker
+        self._ready_waiters = []
+        self.running = False
+        self._cond = threading.Condition()
+        self._loop = None
+
+    @property
+    def ready(self):
+        return self.ready_workers > 0
+
+    async def wait_ready(self):
+        """
+        Wait until the first worker has its models loaded and warmed.
+        Returns: whether one did (False if every worker failed to load)
+        """
+        with self._cond:
+            if self.ready or self.failed_workers >= self.num_workers:
+                return self.ready
+            future = self._loop.create_future()
+            self._ready_waiters.append(future)
+        await future
+        return self.ready
+
+    def start(self, loop):
+        self._loop = loop
+        self.running = True
+        for n in range(self.num_workers):
+            worker = threading.Thread(target=self._work, name=f"inference-{n}", daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
+    def stop(self):
+        with self._cond:
+            self.running = False
+            self._cond.notify_all()
+        for worker in self.workers:
+            worker.join(timeout=2)
+
+    def submit(self, camera_id, seq, frame, captured_at, callback):
+        """
+        Queue a frame for detection without waiting on the model.
+        callback(result) runs on the event loop when the frame is done.
+        Returns: False if an older frame had to be dropped to make room
+        """
+        with self._cond:
+            queue = self.queues.get(camera_id)
+            if queue is None:
+                queue = self.queues[camera_id] = deque()
+                self.stats[camera_id] = CameraQueueStats()
+                if self.tracker_factory is not None:
+                    self.trackers[camera_id] = self.tracker_factory()
+            stats = self.stats[camera_id]
+            stats.submitted += 1
+
+            dropped = False
+            if len(queue) >= self.queue_size:
+                queue.popleft()
+                stats.dropped += 1
+                metrics.FRAMES_DROPPED.labels(str(camera_id), 'inference').inc()
+                dropped = True
+
+            queue.append((seq, frame, captured_at, callback))
+            self._cond.notify()
+        return not dropped
+
+    def snapshot(self):
+        """Queue depth, drops and latency per camera"""
+        with self._cond:
+            cameras = {}
+            for camera_id, stats in self.stats.items():
+                latencies = list(stats.latencies)
+                cameras[camera_id] = {
+                    'queue_depth': len(self.queues[camera_id]),
+                    'det_size': self.det_sizes.get(camera_id),
+                    'submitted': stats.submitted,
+                    'processed': stats.processed,
+                    'dropped': stats.dropped,
+                    'errors': stats.errors,
+                    'recognized': stats.recognized,
+                    'reused': stats.reused,
+                    'latency_ms_p50': float(np.percentile(latencies, 50) * 1000) if latencies else None,
+                    'latency_ms_p95': float(np.percentile(latencies, 95) * 1000) if latencies else None,
+                }
+        return {
+            'workers': self.num_workers,
+            'ready_workers': self.ready_workers,
+            'failed_workers': self.failed_workers,
+            'load_seconds': list(self.load_seconds),
+            'queue_size': self.queue_size,
+            'max_batch': self.max_batch,
+            'avg_batch': self.batched_frames / self.batches if self.batches else None,
+            'cameras': cameras,
+        }
+
+    def _wake_ready_waiters(self):
+        with self._cond:
+            waiters, self._ready_waiters = self._ready_waiters, []
+        for future in waiters:
+            self._loop.call_soon_threadsafe(_resolve, future)
+
+    def _next_job(self):
+        """Oldest queued frame across cameras, so no camera starves"""
+        oldest = None
+        for camera_id, queue in self.queues.items():
+            if queue and (oldest is None or queue[0][2] < self.queues[oldest][0][2]):
+                oldest = camera_id
+        if oldest is None:
+            return None
+        return (oldest,) + self.queues[oldest].popleft()
+
+    def _next_batch(self):
+        """
+        Block until a frame is queued, then gather up to max_batch frames,
+        waiting at most max_wait for stragglers. Call with _cond held.
+        Returns: list of jobs, empty once the pool is stopped
+        """
+        job = self._next_job()
+        while job is None and self.running:
+            self._cond.wait()
+            job = self._next_job()
+        if job is None:
+            return []
+
+        jobs = [job]
+        deadline = time.monotonic() + self.max_wait
+        while len(jobs) < self.max_batch:
+            job = self._next_job()
+            if job is not None:
+                jobs.append(job)
+                continue
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not self.running:
+                break
+            self._cond.wait(timeout=remaining)
+        return jobs
+
+    def set_roi(self, camera_id, roi):
+        """Crop this camera's frames to a RegionOfInterest before detection (None for the full frame)"""
+        with self._cond:
+            if roi is None:
+                self.rois.pop(camera_id, None)
+            else:
+                self.rois[camera_id] = roi
+
+    def set_det_size(self, camera_id, det_size):
+        """Detector input size for this camera's frames (None for the recognizer default)"""
+        with self._cond:
+            if det_size is None:
+                self.det_sizes.pop(camera_id, None)
+            else:
+                self.det_sizes[camera_id] = tuple(det_size)
+
+    def camera_load(self, camera_id, last=20):
+        """
+        Recent load for one camera, for adapting its settings.
+        Returns: dict with total processed and dropped frames, queue depth and p95 latency (s) of the last frames
+        """
+        with self._cond:
+            stats = self.stats.get(camera_id)
+            if stats is None:
+                return None
+            latencies = list(stats.latencies)[-last:]
+            return {
+                'processed': stats.processed,
+                'dropped': stats.dropped,
+                'queue_depth': len(self.queues[camera_id]),
+                'latency_p95': float(np.percentile(latencies, 95)) if latencies else None,
+            }
+
+    def _analyze(self, recognizer, jobs):
+        """
+        Detect faces in a batch of jobs and embed the ones that need it.
+        Returns: (faces per frame, tracks per frame, embedded count per frame)
+        """
+        frames = [job[2] for job in jobs]
+        rois = [self.rois.get(job[0]) for job in jobs]
+        crops = [roi.crop(frame) if roi is not None else (frame, None) for frame, roi in zip(frames, rois)]
+
+        det_sizes = [self.det_sizes.get(job[0]) for job in jobs]
+        start = time.perf_counter()
+        faces_per_frame = recognizer.detect_faces([image for image, _ in crops], det_sizes)
+        # Every frame in the batch waited for the whole batch
+        self._observe_batch('detect', jobs, time.perf_counter() - start)
+        faces_per_frame = [
+            roi.to_frame(faces, transform, frame.shape) if roi is not None else faces
+            for faces, roi, (_, transform), frame in zip(faces_per_frame, rois, crops, frames)
+        ]
+
+        pending = []
+        tracks_per_frame = []
+        recognized = []
+        for (camera_id, seq, frame, captured_at, _), faces in zip(jobs, faces_per_frame):
+            tracker = self.trackers.get(camera_id)
+            tracks = None
+            if tracker is not None:
+                bboxes = np.array([face.bbox for face in faces], dtype=np.float32).reshape(-1, 4)
+                tracks = tracker.update(seq, bboxes, captured_at)
+            count = 0
+            for i, face in enumerate(faces):
+                if tracks is None or tracker.needs_recognition(tracks[i], captured_at):
+                    pending.append((frame, face))
+                    count += 1
+            if tracks is not None:
+                metrics.CACHE_LOOKUPS.labels('track_identity', 'miss').inc(count)
+                metrics.CACHE_LOOKUPS.labels('track_identity', 'hit').inc(len(faces) - count)
+            tracks_per_frame.append(tracks)
+            recognized.append(count)
+
+        # Faces are embedded from the full frame, with kps already mapped back
+        if pending:
+            start = time.perf_counter()
+            recognizer.embed_faces(pending)
+            self._observe_batch('embed', jobs, time.perf_counter() - start)
+        return faces_per_frame, tracks_per_frame, recognized
+
+    def _observe_batch(self, stage, jobs, seconds):
+        for job in jobs:
+            metrics.observe_stage(stage, job[0], seconds)
+
+    def _work(self):
+        started = time.time()
+        try:
+            recognizer = self.recognizer_factory(threads=self.threads_per_worker)
+            recognizer.warmup()
+        except Exception as e:
+            print(f"Inference worker failed to load models: {e}")
+            with self._cond:
+                self.failed_workers += 1
+            self._wake_ready_waiters()
+            return
+
+        with self._cond:
+            self.ready_workers += 1
+            self.load_seconds.append(round(time.time() - started, 3))
+        self._wake_ready_waiters()
+
+        while True:
+            with self._cond:
+                jobs = self._next_batch()
+                if not jobs:
+                    return
+
+            try:
+                faces_per_frame, tracks_per_frame, recognized = self._analyze(recognizer, jobs)
+            except Exception as e:
+                print(f"Face detection error (batch of {len(jobs)}): {e}")
+                with self._cond:
+                    for job in jobs:
+                        self.stats[job[0]].errors += 1
+                continue
+
+            results = [
+                InferenceResult(camera_id, seq, frame, faces, captured_at, tracks)
+                for (camera_id, seq, frame, captured_at, _), faces, tracks
+                in zip(jobs, faces_per_frame, tracks_per_frame)
+            ]
+            with self._cond:
+                self.batches += 1
+                self.batched_frames += len(jobs)
+                for result, count in zip(results, recognized):
+                    stats = self.stats[result.camera_id]
+                    stats.processed += 1
+                    stats.recognized += count
+                    stats.reused += len(result.faces) - count
+                    stats.latencies.append(result.latency)
+
+            for result in results:
+                camera = str(result.camera_id)
+                metrics.FRAMES_PROCESSED.labels(camera).inc()
+                metrics.FRAME_LATENCY_SECONDS.labels(camera).observe(result.latency)
+                metrics.FACES_PER_FRAME.labels(camera).observe(len(result.faces))
+
+            try:
+                for job, result in zip(jobs, results):
+                    self._loop.call_soon_threadsafe(job[4], result)
+            except RuntimeError:
+                # Event loop closed during shutdown
+                return
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
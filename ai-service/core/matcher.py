@@ -0,0 +1,35 @@
+from core import metrics
+
+
+class GalleryMatcher:
+    """
+    Chooses which gallery a frame is matched against.
+    scope='session': only students enrolled in currently open sessions
+    (a few dozen instead of the whole school); scope='all': the full
+    gallery, kept for diagnostics.
+    """
+
+    def __init__(self, gallery_service, roster=None, scope='session'):
+        self.gallery_service = gallery_service
+        self.roster = roster
+        self.scope = scope
+        self._scoped = None
+        self._scoped_key = None
+
+    def gallery(self):
+        gallery = self.gallery_service.gallery
+        if self.scope != 'session' or self.roster is None:
+            return gallery
+
+        # Rebuild the candidate gallery only when either side changed
+        key = (id(gallery), gallery.version, self.roster.version)
+        if key != self._scoped_key:
+            metrics.CACHE_LOOKUPS.labels('candidate_gallery', 'miss').inc()
+            self._scoped = gallery.subset(self.roster.candidates)
+            self._scoped_key = key
+        else:
+            metrics.CACHE_LOOKUPS.labels('candidate_gallery', 'hit').inc()
+        return self._scoped
+
+    def best_matches(self, queries, threshold):
+        return self.gallery().best_matches(queries, threshold)
@@ -0,0 +1,69 @@
+"""
+Prometheus metrics for the recognition pipeline, served at /metrics.
+Stage timings share one histogram labelled by stage and camera (and are
+also kept in the rolling window of core.profiling); gauges
+that mirror in-memory state (queue depths, gallery size...) are set
+right before each scrape.
+"""
+import time
+from contextlib import contextmanager
+from prometheus_client import Counter, Gauge, Histogram
+from core.profiling import stage_timings
+
+# Seconds; spans sub-millisecond dict lookups up to multi-second uploads
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+STAGE_SECONDS = Histogram(
+    'labface_stage_seconds', 'Time spent in each pipeline stage',
+    ['stage', 'camera'], buckets=STAGE_BUCKETS
+)
+FRAME_LATENCY_SECONDS = Histogram(
+    'labface_frame_latency_seconds', 'Capture to detection done, per processed frame',
+    ['camera'], buckets=STAGE_BUCKETS
+)
+EVENT_DELIVERY_SECONDS = Histogram(
+    'labface_event_delivery_seconds', 'Attendance event queued to delivered to the backend',
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0)
+)
+
+FRAMES_CAPTURED = Counter('labface_frames_captured_total', 'Frames decoded from the camera', ['camera'])
+FRAMES_PROCESSED = Counter('labface_frames_processed_total', 'Frames run through detection', ['camera'])
+FRAMES_SKIPPED = Counter('labface_frames_skipped_total', 'Frames not sent to detection', ['camera', 'reason'])
+FRAMES_DROPPED = Counter('labface_frames_dropped_total', 'Frames or results dropped under load', ['camera', 'queue'])
+STREAM_RECONNECTS = Counter('labface_stream_reconnects_total', 'Camera connection failures and reconnects', ['camera'])
+
+FACES_PER_FRAME = Histogram(
+    'labface_faces_per_frame', 'Faces detected per processed frame',
+    ['camera'], buckets=(0, 1, 2, 3, 5, 8, 13, 20)
+)
+MATCH_SCORE = Histogram(
+    'labface_match_score', 'Best gallery similarity per recognized face',
+    ['camera'], buckets=(0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9)
+)
+FACES_RECOGNIZED = Counter('labface_faces_recognized_total', 'Gallery matches by outcome', ['camera', 'result'])
+CACHE_LOOKUPS = Counter('labface_cache_lookups_total', 'Cache lookups by cache and outcome', ['cache', 'result'])
+
+ATTENDANCE_EVENTS = Counter('labface_attendance_events_total', 'Attendance events by outcome', ['result'])
+SNAPSHOTS = Counter('labface_snapshots_total', 'Attendance snapshots by outcome', ['result'])
+
+QUEUE_DEPTH = Gauge('labface_queue_depth', 'Items waiting in each pipeline queue', ['queue', 'camera'])
+GALLERY_SIZE = Gauge('labface_gallery_size', 'Enrolled students in the gallery')
+ROSTER_CANDIDATES = Gauge('labface_roster_candidates', 'Students enrolled in an open session')
+OPEN_SESSIONS = Gauge('labface_open_sessions', 'Sessions without an end time')
+STREAM_VIEWERS = Gauge('labface_stream_viewers', 'Connected /video_feed viewers', ['camera', 'tier'])
+
+
+@contextmanager
+def timed(stage, camera=''):
+    """Observe the duration of the with-block as one stage"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, camera, time.perf_counter() - start)
+
+
+def observe_stage(stage, camera, seconds):
+    camera = str(camera)
+    STAGE_SECONDS.labels(stage, camera).observe(seconds)
+    stage_timings.record(stage, camera, seconds)
@@ -0,0 +1,212 @@
+import asyncio
+import time
+import cv2
+import numpy as np
+from core import metrics
+
+BOUNDARY_HEADER = b'--frame\r\nContent-Type: image/jpeg\r\n\r\n'
+
+
+def mjpeg_part(jpeg_bytes):
+    return BOUNDARY_HEADER + jpeg_bytes + b'\r\n'
+
+
+class StreamTier:
+    """One shared encoding of a camera: output width (0 = native) and JPEG quality"""
+
+    def __init__(self, name, width, quality):
+        self.name = name
+        self.width = width
+        self.quality = quality
+
+    @classmethod
+    def parse_list(cls, spec):
+        """'full:0:80,thumb:320:50' -> [StreamTier, ...]"""
+        tiers = []
+        for item in spec.split(','):
+            if not item.strip():
+                continue
+            name, width, quality = item.strip().split(':')
+            tiers.append(cls(name, int(width), int(quality)))
+        if not tiers:
+            raise ValueError("At least one stream tier is required")
+        return tiers
+
+    def encode(self, frame):
+        """Returns: JPEG bytes, or None if encoding failed"""
+        if self.width and self.width < frame.shape[1]:
+            height = max(1, round(frame.shape[0] * self.width / frame.shape[1]))
+            frame = cv2.resize(frame, (self.width, height), interpolation=cv2.INTER_AREA)
+        ret, buffer = cv2.imencode('.jpg', frame, [int(cv2.IMWRITE_JPEG_QUALITY), self.quality])
+        return buffer.tobytes() if ret else None
+
+
+class FrameBroadcaster:
+    """
+    Encode-once MJPEG fan-out for one camera.
+    Viewers pick one of a small set of shared quality tiers. While a tier
+    has viewers, each new captured frame is encoded for it exactly once
+    (off the event loop) and the same bytes are pushed to every subscriber.
+    Each subscriber has a tiny queue; a slow client just misses frames
+    instead of holding anyone else up, so encoding cost does not depend on
+    the number of viewers. The latest encoding per tier also serves
+    single-frame snapshots.
+    """
+
+    def __init__(self, camera_id, tiers, queue_size=1):
+        self.camera_id = camera_id
+        self.tiers = {tier.name: tier for tier in tiers}
+        self.queue_size = queue_size
+        self.stream = None
+        self.epoch = 0  # Distinguishes capture seqs across stream restarts
+        self.subscribers = {name: set() for name in self.tiers}
+        self.latest = {}  # { tier name: (seq, jpeg bytes) }
+        self.encoded = 0
+        self.dropped = 0
+        self._placeholders = {}
+        self._watched = asyncio.Event()
+        self._task = None
+
+    def attach(self, stream):
+        """Start broadcasting frames from an RTSPStream"""
+        self.stream = stream
+        self.epoch = int(time.time())
+        self.latest = {}
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def pick_tier(self, width=None, quality=None):
+        """
+        Shared tier for a requested width and quality: the smallest tier at
+        least as wide as asked (native counts as widest), then the closest quality.
+        """
+        def tier_width(tier):
+            return tier.width or float('inf')
+
+        tiers = list(self.tiers.values())
+        if width:
+            wide_enough = [tier for tier in tiers if tier_width(tier) >= width]
+            tiers = wide_enough or [max(tiers, key=tier_width)]
+            narrowest = min(tier_width(tier) for tier in tiers)
+            tiers = [tier for tier in tiers if tier_width(tier) == narrowest]
+        else:
+            widest = max(tier_width(tier) for tier in tiers)
+            tiers = [tier for tier in tiers if tier_width(tier) == widest]
+        if quality:
+            return min(tiers, key=lambda tier: abs(tier.quality - quality)).name
+        return max(tiers, key=lambda tier: tier.quality).name
+
+    async def subscribe(self, tier, max_fps=None):
+        """Async generator of multipart chunks for one viewer of a tier"""
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self.subscribers[tier].add(queue)
+        self._watched.set()
+        min_interval = 1.0 / max_fps if max_fps else 0.0
+        last_sent = 0.0
+        try:
+            # Show the latest frame straight away rather than waiting for the next one
+            latest = self.latest.get(tier)
+            yield mjpeg_part(latest[1]) if latest else self.placeholder(tier)
+            while True:
+                try:
+                    part = await asyncio.wait_for(queue.get(), timeout=1.0)
+                except asyncio.TimeoutError:
+                    if tier not in self.latest:
+                        yield self.placeholder(tier)
+                    continue
+                now = time.monotonic()
+                if now - last_sent < min_interval:
+                    continue
+                last_sent = now
+                yield part
+        finally:
+            self.subscribers[tier].discard(queue)
+
+    async def latest_jpeg(self, tier):
+        """
+        Latest frame encoded for a tier, encoding it on demand when no
+        viewer is keeping the tier current.
+        Returns: (seq, jpeg bytes), or None before the first frame
+        """
+        if self.stream is None:
+            return None
+        seq, frame = self.stream.latest()
+        if frame is None:
+            return None
+        cached = self.latest.get(tier)
+        if cached and cached[0] >= seq:
+            return cached
+
+        jpeg = await asyncio.get_running_loop().run_in_executor(None, self._encode, tier, frame)
+        if jpeg is None:
+            return cached
+        cached = self.latest.get(tier)
+        if not cached or cached[0] < seq:
+            self.latest[tier] = (seq, jpeg)
+        return self.latest[tier]
+
+    def placeholder(self, tier):
+        part = self._placeholders.get(tier)
+        if part is None:
+            image = np.zeros((720, 1280, 3), dtype=np.uint8)
+            cv2.putText(image, f"CAM {self.camera_id} Connecting...", (400, 360),
+                        cv2.FONT_HERSHEY_SIMPLEX, 1.5, (255, 255, 255), 3)
+            part = self._placeholders[tier] = mjpeg_part(self.tiers[tier].encode(image))
+        return part
+
+    def stats(self):
+        return {
+            'viewers': {name: len(queues) for name, queues in self.subscribers.items()},
+            'encoded': self.encoded,
+            'dropped': self.dropped,
+        }
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        last_seq = 0
+        while True:
+            if not any(self.subscribers.values()):
+                self._watched.clear()
+                await self._watched.wait()
+
+            last_seq, frame = await self.stream.next_frame(last_seq)
+            if frame is None:
+                continue
+
+            watched = [name for name, queues in self.subscribers.items() if queues]
+            try:
+                encoded = await loop.run_in_executor(None, self._encode_tiers, frame, watched)
+            except Exception as e:
+                print(f"MJPEG encode error (camera {self.camera_id}): {e}")
+                continue
+
+            for name, jpeg in encoded.items():
+                self.latest[name] = (last_seq, jpeg)
+                self.encoded += 1
+                self._publish(name, mjpeg_part(jpeg))
+
+    def _encode_tiers(self, frame, names):
+        encoded = {}
+        for name in names:
+            jpeg = self._encode(name, frame)
+            if jpeg is not None:
+                encoded[name] = jpeg
+        return encoded
+
+    def _encode(self, tier, frame):
+        with metrics.timed('mjpeg_encode', self.camera_id):
+            return self.tiers[tier].encode(frame)
+
+    def _publish(self, tier, part):
+        for queue in self.subscribers[tier]:
+            if queue.full():
+                # Slow consumer: replace its pending frame with the newest one
+                queue.get_nowait()
+                self.dropped += 1
+                metrics.FRAMES_DROPPED.labels(str(self.camera_id), 'mjpeg').inc()
+            queue.put_nowait(part)
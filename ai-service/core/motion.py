@@ -0,0 +1,74 @@
+import cv2
+import numpy as np
+
+
+class MotionGate:
+    """
+    Cheap per-camera motion pre-filter, run before a frame is sent to the
+    detector. Frames are downscaled to a small grayscale image and compared
+    either with the previous one ('diff') or with a MOG2 background model
+    ('mog2'). A frame passes when enough pixels changed; after motion the
+    gate stays open for `hold` seconds, and a keep-alive frame passes every
+    `keepalive` seconds so someone standing still is not missed for long.
+    """
+
+    def __init__(self, method='diff', sensitivity=25, min_area=0.002, keepalive=5.0, hold=1.0, width=160):
+        if method not in ('diff', 'mog2'):
+            raise ValueError(f"Unknown motion method '{method}', expected diff or mog2")
+        self.method = method
+        self.sensitivity = sensitivity  # Per-pixel change (0-255) that counts as motion
+        self.min_area = min_area  # Fraction of the downscaled frame that must change
+        self.keepalive = keepalive
+        self.hold = hold
+        self.width = width
+        self.previous = None
+        self.subtractor = None
+        if method == 'mog2':
+            self.subtractor = cv2.createBackgroundSubtractorMOG2(
+                history=500, varThreshold=sensitivity, detectShadows=False
+            )
+        self.last_motion = 0.0
+        self.last_pass = 0.0
+        self.checked = 0
+        self.skipped = 0
+
+    @property
+    def skipped_fraction(self):
+        return self.skipped / self.checked if self.checked else 0.0
+
+    def should_process(self, frame, now):
+        """Returns: True if the frame should go to the detector"""
+        self.checked += 1
+        if self._has_motion(frame):
+            self.last_motion = now
+
+        if now - self.last_motion <= self.hold or now - self.last_pass >= self.keepalive:
+            self.last_pass = now
+            return True
+        self.skipped += 1
+        return False
+
+    def snapshot(self):
+        return {
+            'method': self.method,
+            'checked': self.checked,
+            'skipped': self.skipped,
+            'skipped_fraction': self.skipped_fraction,
+        }
+
+    def _has_motion(self, frame):
+        height = max(1, int(frame.shape[0] * self.width / frame.shape[1]))
+        small = cv2.resize(frame, (self.width, height), interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+
+        if self.subtractor is not None:
+            mask = self.subtractor.apply(gray)
+            changed = np.count_nonzero(mask)
+        else:
+            gray = cv2.GaussianBlur(gray, (5, 5), 0)
+            previous, self.previous = self.previous, gray
+            if previous is None or previous.shape != gray.shape:
+                return True
+            changed = np.count_nonzero(cv2.absdiff(previous, gray) > self.sensitivity)
+
+        return changed >= self.min_area * gray.size
@@ -0,0 +1,280 @@
+import asyncio
+import json
+import os
+import sqlite3
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from core import metrics
+
+
+class AttendanceOutbox:
+    """
+    Durable local outbox for attendance events and snapshot uploads.
+    Events and encoded snapshots are written to SQLite (WAL mode) before
+    anything goes over the network, so a backend or MinIO outage, a
+    restart or a deploy only delays them. A background drainer replays
+    due rows in batches, deletes them once delivered (or rejected for
+    good) and backs each row off exponentially on transient failures.
+    Every event carries an idempotency key so replays are not applied twice.
+    Events for the same student and session go out strictly in order: while
+    an earlier one is pending, later ones wait (an EXIT must not overtake
+    the ENTRY it closes).
+    All SQLite access runs on one dedicated thread.
+    """
+
+    def __init__(self, path, batch_size=50, base_backoff=1.0, max_backoff=60.0, poll_interval=1.0,
+                 inflight_grace=60.0, max_age=7 * 86400):
+        self.path = path
+        self.batch_size = batch_size
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.poll_interval = poll_interval
+        # A snapshot is left to its uploader this long before the drainer takes over
+        self.inflight_grace = inflight_grace
+        # Events older than this are given up on; the backend keeps idempotency keys as long
+        self.max_age = max_age
+        self.conn = None
+        self.pending_events = 0
+        self.pending_snapshots = 0
+        self.oldest_event_at = None
+        self.delivered = 0
+        self.rejected = 0
+        self.deferred = 0
+        self.expired = 0
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="outbox")
+        self._wake = asyncio.Event()
+        self._task = None
+
+    async def open(self):
+        await self._call(self._open)
+        await self._call(self._count)
+
+    def start(self, send_events, upload_snapshot):
+        """
+        Start the drainer.
+        send_events(payloads) -> list of results with 'success' and 'httpStatus'
+        upload_snapshot(key, data, content_type) raises on failure
+        """
+        self._task = asyncio.create_task(self._run(send_events, upload_snapshot))
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+        if self.conn is not None:
+            await self._call(self.conn.close)
+        self._executor.shutdown(wait=False)
+
+    async def add_event(self, session_id, student_id, direction, snapshot_url=None, occurred_at=None):
+        """
+        Durably queue an attendance event for delivery.
+        Returns: the event's idempotency key
+        """
+        key = uuid.uuid4().hex
+        payload = {
+            "sessionId": session_id,
+            "studentId": student_id,
+            "direction": direction,
+            "snapshotUrl": snapshot_url,
+            "occurredAt": datetime.fromtimestamp(occurred_at or time.time(), timezone.utc).isoformat(),
+        }
+        await self._call(self._insert_event, key, json.dumps(payload), f"{session_id}:{student_id}")
+        self.pending_events += 1
+        self._wake.set()
+        return key
+
+    async def add_snapshot(self, key, data, content_type):
+        """Durably keep an encoded snapshot until it has been uploaded"""
+        await self._call(self._execute, (
+            "INSERT OR REPLACE INTO snapshots (object_key, data, content_type, created_at, attempts, next_attempt) "
+            "VALUES (?, ?, ?, ?, 0, ?)"
+        ), (key, sqlite3.Binary(data), content_type, time.time(), time.time() + self.inflight_grace))
+        self.pending_snapshots += 1
+
+    async def remove_snapshot(self, key):
+        await self._call(self._execute, "DELETE FROM snapshots WHERE object_key = ?", (key,))
+        self.pending_snapshots = max(0, self.pending_snapshots - 1)
+
+    async def defer_snapshot(self, key):
+        """Leave an upload that just failed for the drainer, after a backoff"""
+        await self._call(self._defer, "snapshots", "object_key", [key])
+
+    def stats(self):
+        return {
+            'pending_events': self.pending_events,
+            'pending_snapshots': self.pending_snapshots,
+            'oldest_event_age': time.time() - self.oldest_event_at if self.oldest_event_at else None,
+            'delivered': self.delivered,
+            'rejected': self.rejected,
+            'deferred': self.deferred,
+            'expired': self.expired,
+        }
+
+    async def _run(self, send_events, upload_snapshot):
+        while True:
+            try:
+                drained = await self._drain_events(send_events)
+                drained += await self._drain_snapshots(upload_snapshot)
+                await self._call(self._count)
+            except Exception as e:
+                print(f"Outbox drain error: {e}")
+                drained = 0
+
+            # Full batches mean more is due: go again straight away
+            if drained < self.batch_size:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wake.clear()
+
+    async def _drain_events(self, send_events):
+        expired = await self._call(self._expire_events)
+        if expired:
+            print(f"Outbox: dropped {expired} attendance events older than {self.max_age / 3600:.0f}h")
+            self.expired += expired
+            metrics.ATTENDANCE_EVENTS.labels('expired').inc(expired)
+        rows = await self._call(self._due_events)
+        if not rows:
+            return 0
+
+        payloads = []
+        for key, payload, _ in rows:
+            payload = json.loads(payload)
+            payload["idempotencyKey"] = key
+            payloads.append(payload)
+        results = await send_events(payloads)
+
+        done = []
+        retry = []
+        for (key, _, created_at), result in zip(rows, results):
+            status = result.get("httpStatus")
+            if result.get("success"):
+                done.append(key)
+                self.delivered += 1
+                metrics.ATTENDANCE_EVENTS.labels('delivered').inc()
+                metrics.EVENT_DELIVERY_SECONDS.observe(time.time() - created_at)
+            elif status is not None and 400 <= status < 500:
+                # The backend rejected it (no entry to exit from, not enrolled...); retrying will not help
+                print(f"Attendance event {key} rejected: {status} {result.get('error', '')}")
+                done.append(key)
+                self.rejected += 1
+                metrics.ATTENDANCE_EVENTS.labels('rejected').inc()
+            else:
+                retry.append(key)
+                self.deferred += 1
+                metrics.ATTENDANCE_EVENTS.labels('deferred').inc()
+
+        if done:
+            await self._call(self._delete, "events", "event_key", done)
+        if retry:
+            await self._call(self._defer, "events", "event_key", retry)
+        return len(rows)
+
+    async def _drain_snapshots(self, upload_snapshot):
+        rows = await self._call(self._due, "SELECT object_key, data, content_type FROM snapshots")
+        for key, data, content_type in rows:
+            try:
+                await upload_snapshot(key, bytes(data), content_type)
+            except Exception as e:
+                print(f"Snapshot upload retry failed ({key}): {e}")
+                await self.defer_snapshot(key)
+                self.deferred += 1
+                continue
+            await self.remove_snapshot(key)
+        return len(rows)
+
+    async def _call(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    # Everything below runs on the outbox thread
+
+    def _open(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS events ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, event_key TEXT UNIQUE NOT NULL, payload TEXT NOT NULL, "
+            "created_at REAL NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, next_attempt REAL NOT NULL, "
+            "order_key TEXT)"
+        )
+        # Outboxes written before order_key existed: add it and fill it in from the payloads
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(events)")]
+        if "order_key" not in columns:
+            self.conn.execute("ALTER TABLE events ADD COLUMN order_key TEXT")
+        for event_key, payload in self.conn.execute(
+            "SELECT event_key, payload FROM events WHERE order_key IS NULL"
+        ).fetchall():
+            payload = json.loads(payload)
+            self.conn.execute("UPDATE events SET order_key = ? WHERE event_key = ?",
+                              (f"{payload['sessionId']}:{payload['studentId']}", event_key))
+        self.conn.execute("CREATE INDEX IF NOT EXISTS events_order ON events (order_key, id)")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS snapshots ("
+            "object_key TEXT PRIMARY KEY, data BLOB NOT NULL, content_type TEXT NOT NULL, "
+            "created_at REAL NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, next_attempt REAL NOT NULL)"
+        )
+        self.conn.commit()
+
+    def _execute(self, sql, params):
+        self.conn.execute(sql, params)
+        self.conn.commit()
+
+    def _insert_event(self, key, payload, order_key):
+        now = time.time()
+        self._execute(
+            "INSERT INTO events (event_key, payload, created_at, attempts, next_attempt, order_key) "
+            "VALUES (?, ?, ?, 0, ?, ?)",
+            (key, payload, now, now, order_key)
+        )
+
+    def _due_events(self):
+        # Only the oldest pending event per student and session, so a deferred
+        # entry holds back its exit instead of the exit arriving first and being rejected
+        return self.conn.execute(
+            "SELECT event_key, payload, created_at FROM events e WHERE next_attempt <= ? "
+            "AND NOT EXISTS (SELECT 1 FROM events p WHERE p.order_key = e.order_key AND p.id < e.id) "
+            "ORDER BY id LIMIT ?",
+            (time.time(), self.batch_size)
+        ).fetchall()
+
+    def _expire_events(self):
+        cursor = self.conn.execute("DELETE FROM events WHERE created_at < ?", (time.time() - self.max_age,))
+        self.conn.commit()
+        return cursor.rowcount
+
+    def _due(self, select):
+        return self.conn.execute(
+            f"{select} WHERE next_attempt <= ? ORDER BY created_at LIMIT ?",
+            (time.time(), self.batch_size)
+        ).fetchall()
+
+    def _delete(self, table, column, keys):
+        self.conn.executemany(f"DELETE FROM {table} WHERE {column} = ?", [(key,) for key in keys])
+        self.conn.commit()
+
+    def _defer(self, table, column, keys):
+        now = time.time()
+        for key in keys:
+            row = self.conn.execute(f"SELECT attempts FROM {table} WHERE {column} = ?", (key,)).fetchone()
+            if row is None:
+                continue
+            attempts = row[0] + 1
+            delay = min(self.max_backoff, self.base_backoff * 2 ** (attempts - 1))
+            self.conn.execute(
+                f"UPDATE {table} SET attempts = ?, next_attempt = ? WHERE {column} = ?",
+                (attempts, now + delay, key)
+            )
+        self.conn.commit()
+
+    def _count(self):
+        events, oldest = self.conn.execute("SELECT COUNT(*), MIN(created_at) FROM events").fetchone()
+        snapshots = self.conn.execute("SELECT COUNT(*) FROM snapshots").fetchone()[0]
+        self.pending_events = events
+        self.pending_snapshots = snapshots
+        self.oldest_event_at = oldest
@@ -0,0 +1,120 @@
+import os
+import sys
+import threading
+import time
+from collections import deque, Counter
+import numpy as np
+
+
+class StageTimings:
+    """
+    Rolling window of recent durations per (camera, stage), fed by the
+    same spans as the Prometheus stage histogram. Recording is a deque
+    append, so it stays on in production; window=0 turns it off.
+    """
+
+    def __init__(self, window=500):
+        self.window = window
+        self.spans = {}  # { (camera, stage): deque of seconds }
+        self.started = time.time()
+
+    def record(self, stage, camera, seconds):
+        if not self.window:
+            return
+        spans = self.spans.get((camera, stage))
+        if spans is None:
+            spans = self.spans.setdefault((camera, stage), deque(maxlen=self.window))
+        spans.append(seconds)
+
+    def reset(self):
+        self.spans = {}
+        self.started = time.time()
+
+    def snapshot(self):
+        """
+        Returns: { camera: { stage: {count, mean_ms, p50_ms, p95_ms, p99_ms, max_ms} } }
+        ('' is the camera for stages not tied to one, e.g. backend_mark)
+        """
+        cameras = {}
+        for (camera, stage), spans in list(self.spans.items()):
+            values = np.array(spans, dtype=np.float64) * 1000
+            if not len(values):
+                continue
+            p50, p95, p99 = np.percentile(values, [50, 95, 99])
+            cameras.setdefault(camera, {})[stage] = {
+                'count': len(values),
+                'mean_ms': float(values.mean()),
+                'p50_ms': float(p50),
+                'p95_ms': float(p95),
+                'p99_ms': float(p99),
+                'max_ms': float(values.max()),
+            }
+        return cameras
+
+
+class SamplingProfiler:
+    """
+    Statistical profiler for the whole process: a background thread
+    snapshots every thread's Python stack each `interval` seconds via
+    sys._current_frames(). Nothing is hooked into the interpreter, so
+    code runs at full speed when no profile is in progress.
+    Output is collapsed stacks ("thread;outer;...;inner count"), the input
+    format of flamegraph.pl and speedscope.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.samples = Counter()
+        self.sample_count = 0
+
+    def run(self, seconds):
+        """Sample for `seconds` (blocking). Call from a worker thread."""
+        own = threading.get_ident()
+        names = {}
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            if len(names) != threading.active_count():
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident != own:
+                    self.samples[self._collapse(names.get(ident, str(ident)), frame)] += 1
+            self.sample_count += 1
+            time.sleep(self.interval)
+
+    @staticmethod
+    def _collapse(thread_name, frame):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)})")
+            frame = frame.f_back
+        stack.append(thread_name)
+        return ";".join(reversed(stack))
+
+    def collapsed(self):
+        return "\n".join(f"{stack} {count}" for stack, count in self.samples.most_common()) + "\n"
+
+    def top(self, limit=30):
+        """
+        Functions ranked by samples with them on top of the stack (self) and anywhere on it (total).
+        Returns: dict with sample counts and the ranked functions
+        """
+        own = Counter()
+        total = Counter()
+        for stack, count in self.samples.items():
+            frames = stack.split(";")[1:]
+            if not frames:
+                continue
+            own[frames[-1]] += count
+            for function in set(frames):
+                total[function] += count
+        return {
+            'samples': self.sample_count,
+            'interval_ms': self.interval * 1000,
+            'self': [{'function': f, 'samples': n} for f, n in own.most_common(limit)],
+            'total': [{'function': f, 'samples': n} for f, n in total.most_common(limit)],
+        }
+
+
+# Shared by every instrumented stage; main.py sets the window size
+stage_timings = StageTimings()
@@ -0,0 +1,97 @@
+import cv2
+import numpy as np
+
+
+class RegionOfInterest:
+    """
+    Door zone of one camera, given in coordinates relative to the frame
+    (0-1), so it holds whatever size the stream is resized to.
+    Frames are cropped to the zone's bounding box before detection,
+    optionally upscaled so faces cover more detector pixels, and, for a
+    polygon, pixels outside the zone are blanked. Detections are mapped
+    back to full-frame coordinates and faces centred outside the zone are
+    dropped.
+    """
+
+    def __init__(self, points, upscale=1.0):
+        points = np.asarray(points, dtype=np.float32).reshape(-1, 2)
+        if len(points) == 2:
+            (x1, y1), (x2, y2) = points
+            points = np.array([[x1, y1], [x2, y1], [x2, y2], [x1, y2]], dtype=np.float32)
+            self.is_rect = True
+        else:
+            self.is_rect = False
+        if len(points) < 3 or points.min() < 0 or points.max() > 1:
+            raise ValueError("ROI needs a rectangle or polygon with coordinates between 0 and 1")
+        self.points = points
+        self.upscale = max(1.0, upscale)
+        self._masks = {}  # { (height, width): polygon mask for the cropped region }
+
+    @classmethod
+    def parse(cls, spec, upscale=1.0):
+        """
+        spec: 'x1,y1,x2,y2' for a rectangle or 'x,y;x,y;x,y;...' for a polygon
+        Returns: RegionOfInterest, or None for an empty spec
+        """
+        if not spec or not spec.strip():
+            return None
+        if ';' in spec:
+            points = [[float(v) for v in point.split(',')] for point in spec.split(';') if point.strip()]
+        else:
+            points = [float(v) for v in spec.split(',')]
+        return cls(points, upscale)
+
+    def crop(self, frame):
+        """
+        Returns: (image to run detection on, (offset_x, offset_y, scale))
+        """
+        height, width = frame.shape[:2]
+        x1, y1, x2, y2 = self._bounds(width, height)
+        image = frame[y1:y2, x1:x2]
+
+        if not self.is_rect:
+            mask = self._mask(width, height)
+            image = cv2.bitwise_and(image, image, mask=mask)
+
+        scale = 1.0
+        if self.upscale > 1.0:
+            scale = self.upscale
+            image = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_LINEAR)
+        return image, (x1, y1, scale)
+
+    def to_frame(self, faces, transform, frame_shape):
+        """
+        Map faces detected on a crop back to full-frame coordinates.
+        Returns: faces whose centre lies inside the zone
+        """
+        offset_x, offset_y, scale = transform
+        offset = np.array([offset_x, offset_y], dtype=np.float32)
+        height, width = frame_shape[:2]
+        polygon = self.points * np.array([width, height], dtype=np.float32)
+
+        kept = []
+        for face in faces:
+            face.bbox = face.bbox / scale + np.tile(offset, 2)
+            if face.kps is not None:
+                face.kps = face.kps / scale + offset
+            center = ((face.bbox[0] + face.bbox[2]) / 2, (face.bbox[1] + face.bbox[3]) / 2)
+            if self.is_rect or cv2.pointPolygonTest(polygon, (float(center[0]), float(center[1])), False) >= 0:
+                kept.append(face)
+        return kept
+
+    def _bounds(self, width, height):
+        x1 = int(np.floor(self.points[:, 0].min() * width))
+        y1 = int(np.floor(self.points[:, 1].min() * height))
+        x2 = int(np.ceil(self.points[:, 0].max() * width))
+        y2 = int(np.ceil(self.points[:, 1].max() * height))
+        return x1, y1, max(x2, x1 + 1), max(y2, y1 + 1)
+
+    def _mask(self, width, height):
+        mask = self._masks.get((height, width))
+        if mask is None:
+            x1, y1, x2, y2 = self._bounds(width, height)
+            polygon = self.points * np.array([width, height], dtype=np.float32) - np.array([x1, y1], dtype=np.float32)
+            mask = np.zeros((y2 - y1, x2 - x1), dtype=np.uint8)
+            cv2.fillPoly(mask, [np.round(polygon).astype(np.int32)], 255)
+            self._masks[(height, width)] = mask
+        return mask
@@ -0,0 +1,110 @@
+import asyncio
+import json
+import aiomysql
+
+ER_NO_SUCH_TABLE = 1146
+
+
+class SessionRoster:
+    """
+    Students who can currently produce an attendance event: those enrolled
+    in an open session (end_time IS NULL), narrowed to batch_students for
+    batch sessions. Rebuilt in bulk from the sessions table on a short interval.
+    """
+
+    def __init__(self, db_pool, refresh_interval=15):
+        self.db_pool = db_pool
+        self.refresh_interval = refresh_interval
+        self.student_sessions = {}  # { student id: open session row }
+        self.session_ids = frozenset()
+        self.version = 0  # Bumped whenever the candidate set changes
+        self._wake = asyncio.Event()
+
+    @property
+    def candidates(self):
+        return self.student_sessions.keys()
+
+    async def refresh(self):
+        """Rebuild the student -> open session map"""
+        async with self.db_pool.acquire() as conn:
+            async with conn.cursor(aiomysql.DictCursor) as cursor:
+                await cursor.execute(
+                    "SELECT id, class_id, type, batch_students, start_time "
+                    "FROM sessions WHERE end_time IS NULL ORDER BY start_time"
+                )
+                sessions = await cursor.fetchall()
+
+                enrollments = []
+                if sessions:
+                    class_ids = list({session['class_id'] for session in sessions})
+                    placeholders = ", ".join(["%s"] * len(class_ids))
+                    # enrollments is the table the backend's class roster import writes; rows
+                    # for students without an account yet have no student_id
+                    try:
+                        await cursor.execute(
+                            f"SELECT class_id, student_id FROM enrollments "
+                            f"WHERE class_id IN ({placeholders}) AND student_id IS NOT NULL",
+                            class_ids
+                        )
+                    except aiomysql.ProgrammingError as e:
+                        if e.args and e.args[0] == ER_NO_SUCH_TABLE:
+                            print("!!! Session roster: table 'enrollments' does not exist - no student can be "
+                                  "matched to an open session until the backend creates it !!!")
+                        raise
+                    enrollments = await cursor.fetchall()
+
+        student_sessions = self._build(sessions, enrollments)
+        session_ids = frozenset(session['id'] for session in sessions)
+
+        if session_ids != self.session_ids or student_sessions.keys() != self.student_sessions.keys():
+            print(f"Session roster: {len(session_ids)} open sessions, {len(student_sessions)} candidate students")
+            if session_ids and not student_sessions:
+                print("!!! Session roster: sessions are open but none of their classes has enrolled students "
+                      "with accounts - nobody can be recognized with MATCH_SCOPE=session !!!")
+            self.version += 1
+        self.student_sessions = student_sessions
+        self.session_ids = session_ids
+
+    def request_refresh(self):
+        self._wake.set()
+
+    async def run(self):
+        """Background loop: refresh on interval or when pinged"""
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                print(f"Session roster refresh error: {e}")
+
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.refresh_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    @staticmethod
+    def _build(sessions, enrollments):
+        by_class = {}
+        for rank, session in enumerate(sessions):
+            allowed = None
+            if session['type'] == 'batch' and session['batch_students']:
+                try:
+                    allowed = {int(sid) for sid in json.loads(session['batch_students'])}
+                except (ValueError, TypeError):
+                    print(f"Invalid batch_students for session {session['id']}")
+                    continue
+            by_class.setdefault(session['class_id'], []).append((rank, session, allowed))
+
+        # Sessions arrive oldest first; a student in several open sessions (possibly of
+        # different classes) belongs to the latest-started one, whatever the enrollment order
+        student_sessions = {}
+        ranks = {}
+        for enrollment in enrollments:
+            student_id = int(enrollment['student_id'])
+            for rank, session, allowed in by_class.get(enrollment['class_id'], ()):
+                if allowed is not None and student_id not in allowed:
+                    continue
+                if rank > ranks.get(student_id, -1):
+                    ranks[student_id] = rank
+                    student_sessions[student_id] = session
+        return student_sessions
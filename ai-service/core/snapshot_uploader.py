@@ -0,0 +1,153 @@
+import asyncio
+import io
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import cv2
+import numpy as np
+from core import metrics
+
+_FORMATS = {
+    'jpg': ('.jpg', cv2.IMWRITE_JPEG_QUALITY, 'image/jpeg'),
+    'webp': ('.webp', cv2.IMWRITE_WEBP_QUALITY, 'image/webp'),
+}
+
+
+class SnapshotUploader:
+    """
+    Background stage for attendance snapshots.
+    submit() only copies the face crop and picks its object key, so the
+    attendance mark can go out straight away with the final URL. Crops
+    wait in a bounded queue; encoding (optional downscale, JPEG or WebP)
+    runs on a small thread pool and uploads run concurrently through the
+    MinIO client's connection pool, retried with backoff. With an outbox,
+    each encoded snapshot is stored there until its upload succeeds, so
+    uploads that keep failing are retried later by the outbox drainer.
+    """
+
+    def __init__(self, minio_client, bucket="labface", image_format='jpg', quality=85, max_side=0,
+                 queue_size=100, upload_concurrency=4, encode_workers=2, retries=3, backoff=0.5, outbox=None):
+        if image_format not in _FORMATS:
+            raise ValueError(f"Unknown snapshot format '{image_format}', expected jpg or webp")
+        self.minio_client = minio_client
+        self.bucket = bucket
+        self.image_format = image_format
+        self.quality = quality
+        self.max_side = max_side  # Downscale so the longer side is at most this (0 keeps size)
+        self.upload_concurrency = upload_concurrency
+        self.retries = retries
+        self.outbox = outbox
+        self.backoff = backoff
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.encode_executor = ThreadPoolExecutor(max_workers=encode_workers, thread_name_prefix="snapshot-encode")
+        self.upload_executor = ThreadPoolExecutor(max_workers=upload_concurrency, thread_name_prefix="snapshot-upload")
+        self.uploaded = 0
+        self.failed = 0
+        self.dropped = 0
+        self.latencies = deque(maxlen=200)  # Seconds from submit to upload done
+        self._workers = []
+
+    def start(self):
+        self._workers = [asyncio.create_task(self._work()) for _ in range(self.upload_concurrency)]
+
+    async def close(self, timeout=5.0):
+        """Give queued snapshots a moment to finish, then stop"""
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            print(f"Snapshot uploader stopped with {self.queue.qsize()} snapshots pending")
+        for worker in self._workers:
+            worker.cancel()
+        self.encode_executor.shutdown(wait=False)
+        self.upload_executor.shutdown(wait=False)
+
+    def submit(self, face_crop, student_id, session_id):
+        """
+        Queue a face crop for encoding and upload.
+        Returns: the snapshot URL it will be stored at, or None if it was dropped
+        """
+        if self.minio_client is None:
+            return None
+
+        extension = _FORMATS[self.image_format][0]
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        key = f"attendance/{session_id}/{student_id}_{timestamp}{extension}"
+
+        try:
+            # Copy so the queued crop does not keep the whole frame alive
+            self.queue.put_nowait((key, np.ascontiguousarray(face_crop).copy(), time.time()))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            metrics.SNAPSHOTS.labels('dropped').inc()
+            print(f"Snapshot queue full, dropping snapshot for student {student_id}")
+            return None
+        return f"/minio/{self.bucket}/{key}"
+
+    def stats(self):
+        latencies = list(self.latencies)
+        return {
+            'queue_depth': self.queue.qsize(),
+            'uploaded': self.uploaded,
+            'failed': self.failed,
+            'dropped': self.dropped,
+            'upload_ms_p50': float(np.percentile(latencies, 50) * 1000) if latencies else None,
+            'upload_ms_p95': float(np.percentile(latencies, 95) * 1000) if latencies else None,
+        }
+
+    async def _work(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            key, crop, submitted_at = await self.queue.get()
+            content_type = _FORMATS[self.image_format][2]
+            stored = False
+            try:
+                with metrics.timed('snapshot_encode'):
+                    data = await loop.run_in_executor(self.encode_executor, self._encode, crop)
+                if self.outbox is not None:
+                    await self.outbox.add_snapshot(key, data, content_type)
+                    stored = True
+                await self.upload(key, data, content_type)
+                self.uploaded += 1
+                metrics.SNAPSHOTS.labels('uploaded').inc()
+                self.latencies.append(time.time() - submitted_at)
+                if stored:
+                    await self.outbox.remove_snapshot(key)
+            except Exception as e:
+                self.failed += 1
+                metrics.SNAPSHOTS.labels('failed').inc()
+                if stored:
+                    print(f"MinIO upload error ({key}), kept in outbox: {e}")
+                    await self.outbox.defer_snapshot(key)
+                else:
+                    print(f"MinIO upload error ({key}): {e}")
+            finally:
+                self.queue.task_done()
+
+    def _encode(self, crop):
+        if self.max_side and max(crop.shape[:2]) > self.max_side:
+            scale = self.max_side / max(crop.shape[:2])
+            crop = cv2.resize(crop, (max(1, round(crop.shape[1] * scale)), max(1, round(crop.shape[0] * scale))),
+                              interpolation=cv2.INTER_AREA)
+        extension, quality_flag, _ = _FORMATS[self.image_format]
+        ret, buffer = cv2.imencode(extension, crop, [int(quality_flag), self.quality])
+        if not ret:
+            raise ValueError("snapshot encoding failed")
+        return buffer.tobytes()
+
+    async def upload(self, key, data, content_type):
+        """Upload encoded bytes, retrying with backoff"""
+        loop = asyncio.get_running_loop()
+        for attempt in range(self.retries + 1):
+            try:
+                with metrics.timed('snapshot_upload'):
+                    return await loop.run_in_executor(
+                        self.upload_executor,
+                        lambda: self.minio_client.put_object(
+                            self.bucket, key, io.BytesIO(data), length=len(data), content_type=content_type
+                        )
+                    )
+            except Exception:
+                if attempt == self.retries:
+                    raise
+                await asyncio.sleep(self.backoff * 2 ** attempt)
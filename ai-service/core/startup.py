@@ -0,0 +1,89 @@
+import asyncio
+import time
+from contextlib import contextmanager
+
+
+class StartupProgress:
+    """
+    What the service has loaded so far, for /health/ready: named steps
+    with their start time, duration and error, plus one-off milestones
+    (e.g. the first frame detected). wait() lets tasks sleep until a step
+    is done (or has failed) instead of polling for it. Steps and milestones are recorded
+    from the event loop.
+    """
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.steps = {}  # { name: {'state', 'started', 'seconds', 'error'} }
+        self.milestones = {}  # { name: seconds since start }
+        self._waiters = {}  # { name: [futures] }
+
+    @contextmanager
+    def step(self, name):
+        self.begin(name)
+        try:
+            yield
+        except Exception as e:
+            self.fail(name, e)
+            raise
+        self.done(name)
+
+    def begin(self, name):
+        self.steps[name] = {'state': 'loading', 'started': time.time(), 'seconds': None, 'error': None}
+
+    def done(self, name):
+        step = self.steps.setdefault(name, {'started': time.time(), 'error': None})
+        step['state'] = 'done'
+        step['seconds'] = round(time.time() - step['started'], 3)
+        print(f"Startup: {name} ready in {step['seconds']:.2f}s")
+        self._wake(name)
+
+    def fail(self, name, error):
+        step = self.steps.setdefault(name, {'started': time.time()})
+        step['state'] = 'failed'
+        step['seconds'] = round(time.time() - step['started'], 3)
+        step['error'] = str(error)
+        print(f"Startup: {name} failed after {step['seconds']:.2f}s: {error}")
+        self._wake(name)
+
+    def is_done(self, name):
+        step = self.steps.get(name)
+        return step is not None and step['state'] == 'done'
+
+    def mark(self, name):
+        """Record a milestone the first time it happens"""
+        if name not in self.milestones:
+            self.milestones[name] = round(time.time() - self.started_at, 3)
+            print(f"Startup: {name} after {self.milestones[name]:.2f}s")
+
+    async def wait(self, name):
+        """
+        Sleep until the step is done or has failed.
+        Returns: True if it is done, False if it failed
+        """
+        step = self.steps.get(name)
+        if step is None or step['state'] == 'loading':
+            future = asyncio.get_running_loop().create_future()
+            self._waiters.setdefault(name, []).append(future)
+            await future
+        return self.is_done(name)
+
+    def snapshot(self):
+        now = time.time()
+        return {
+            'uptime': round(now - self.started_at, 3),
+            'steps': {
+                name: {
+                    'state': step['state'],
+                    'seconds': step['seconds'] if step['seconds'] is not None else round(now - step['started'], 3),
+                    'error': step['error'],
+                }
+                for name, step in self.steps.items()
+            },
+            'milestones': dict(self.milestones),
+        }
+
+    def _wake(self, name):
+        for future in self._waiters.pop(name, []):
+            if not future.done():
+                future.set_result(None)
@@ -1,49 +1,120 @@
+import asyncio
 import cv2
 import time
 import threading
+from core import metrics
 
 class RTSPStream:
-    def __init__(self, rtsp_url):
+    """
+    Captures and decodes an RTSP stream on its own thread, keeping only the
+    latest frame. Async consumers wait on next_frame() without ever blocking
+    the event loop on cv2 I/O.
+    """
+
+    def __init__(self, rtsp_url, frame_size=None, name=None, camera_id=None):
         self.rtsp_url = rtsp_url
+        self.frame_size = frame_size  # (width, height) to resize to, None keeps source size
+        self.name = name or rtsp_url
+        self.metrics_label = str(camera_id) if camera_id is not None else self.name
         self.cap = None
         self.frame = None
+        self.seq = 0  # Increments on every decoded frame
+        self.frame_time = 0.0
         self.running = False
+        self.thread = None
         self.lock = threading.Lock()
+        self._loop = None
+        self._frame_event = None
 
-    def start(self):
+    def start(self, loop=None):
+        """Start the capture thread. Pass the event loop to use next_frame()."""
         self.running = True
-        self.thread = threading.Thread(target=self._update)
+        if loop is not None:
+            self._loop = loop
+            self._frame_event = asyncio.Event()
+        self.thread = threading.Thread(target=self._update, name=f"capture-{self.name}", daemon=True)
         self.thread.start()
 
+    def _open(self):
+        cap = cv2.VideoCapture(self.rtsp_url)
+        cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        return cap
+
     def _update(self):
+        label = self.metrics_label
         while self.running:
             if self.cap is None or not self.cap.isOpened():
-                self.cap = cv2.VideoCapture(self.rtsp_url)
+                self.cap = self._open()
                 if not self.cap.isOpened():
-                    print(f"Failed to connect to {self.rtsp_url}. Retrying in 5s...")
-                    time.sleep(5)
+                    print(f"{self.name} failed to connect. Retrying in 10s...")
+                    metrics.STREAM_RECONNECTS.labels(label).inc()
+                    time.sleep(10)
                     continue
 
-            ret, frame = self.cap.read()
+            with metrics.timed('capture', label):
+                ret, frame = self.cap.read()
             if not ret:
-                print("Frame read failed. Reconnecting...")
+                print(f"Failed to read frame from {self.name}. Reconnecting...")
+                metrics.STREAM_RECONNECTS.labels(label).inc()
                 self.cap.release()
                 self.cap = None
+                time.sleep(1)
                 continue
 
+            metrics.FRAMES_CAPTURED.labels(label).inc()
+            if self.frame_size:
+                try:
+                    with metrics.timed('resize', label):
+                        frame = cv2.resize(frame, self.frame_size)
+                except Exception:
+                    pass
+
+            # Published frames are never written to again, so readers can
+            # share them without copying
             with self.lock:
                 self.frame = frame
-            
-            # Limit frame rate to save CPU
-            time.sleep(0.03) 
+                self.seq += 1
+                self.frame_time = time.time()
+
+            if self._loop is not None:
+                try:
+                    self._loop.call_soon_threadsafe(self._frame_event.set)
+                except RuntimeError:
+                    # Event loop closed during shutdown
+                    break
+
+        if self.cap:
+            self.cap.release()
+
+    def latest(self):
+        """Returns: (seq, frame) of the most recent frame, without copying"""
+        with self.lock:
+            return self.seq, self.frame
 
     def read(self):
         with self.lock:
             return self.frame.copy() if self.frame is not None else None
 
+    async def next_frame(self, last_seq, timeout=1.0):
+        """
+        Wait for a frame newer than last_seq.
+        Returns: (seq, frame), or (last_seq, None) on timeout
+        """
+        while True:
+            seq, frame = self.latest()
+            if seq > last_seq and frame is not None:
+                return seq, frame
+            self._frame_event.clear()
+            # Re-check after clearing so a frame published in between is not missed
+            seq, frame = self.latest()
+            if seq > last_seq and frame is not None:
+                return seq, frame
+            try:
+                await asyncio.wait_for(self._frame_event.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                return last_seq, None
+
     def stop(self):
         self.running = False
         if self.thread:
-            self.thread.join()
-        if self.cap:
-            self.cap.release()
+            self.thread.join(timeout=2)
@@ -0,0 +1,119 @@
+import threading
+import numpy as np
+
+
+class Track:
+    """One face followed across frames, with the identity last matched to it"""
+
+    def __init__(self, track_id, bbox, now):
+        self.id = track_id
+        self.bbox = bbox
+        self.first_seen = now
+        self.last_seen = now
+        self.hits = 1
+        self.identity = None  # (student, score) from the last gallery match
+        self.checked_at = None  # When an embedding was last scheduled for this track
+
+    def set_identity(self, student, score):
+        self.identity = (student, score)
+
+
+class FaceTracker:
+    """
+    Lightweight per-camera tracker over detector bboxes.
+    Detections are associated to existing tracks greedily by IoU, falling
+    back to centroid distance for fast movers. A face only needs the ArcFace
+    embedding and gallery match when its track is new or due for
+    re-verification; in between the cached identity is reused.
+    Used from inference worker threads, so updates are serialized.
+    """
+
+    def __init__(self, iou_threshold=0.3, centroid_factor=0.5, max_age=1.0,
+                 reverify_interval=2.0, unknown_retry=0.5):
+        self.iou_threshold = iou_threshold
+        self.centroid_factor = centroid_factor  # Max centroid shift as a fraction of box size
+        self.max_age = max_age  # Seconds a track survives without detections
+        self.reverify_interval = reverify_interval
+        self.unknown_retry = unknown_retry  # Retry sooner while a track has no match
+        self.tracks = []
+        self.last_seq = 0
+        self._next_id = 1
+        self._lock = threading.Lock()
+
+    def update(self, seq, bboxes, now):
+        """
+        Associate one frame's detections with tracks.
+        bboxes: (n, 4) array of x1, y1, x2, y2
+        Returns: list of Track parallel to bboxes, or None for a frame older
+        than one already applied (it is then recognized without tracking)
+        """
+        with self._lock:
+            if seq <= self.last_seq:
+                return None
+            self.last_seq = seq
+
+            self.tracks = [t for t in self.tracks if now - t.last_seen <= self.max_age]
+            assigned = [None] * len(bboxes)
+            free_tracks = set(range(len(self.tracks)))
+
+            for score, ti, di in self._candidates(bboxes):
+                if ti in free_tracks and assigned[di] is None:
+                    track = self.tracks[ti]
+                    track.bbox = bboxes[di]
+                    track.last_seen = now
+                    track.hits += 1
+                    assigned[di] = track
+                    free_tracks.discard(ti)
+
+            for di, track in enumerate(assigned):
+                if track is None:
+                    track = Track(self._next_id, bboxes[di], now)
+                    self._next_id += 1
+                    self.tracks.append(track)
+                    assigned[di] = track
+            return assigned
+
+    def needs_recognition(self, track, now):
+        """
+        Whether to embed this track's face now. Marks it as checked when so,
+        so concurrent frames do not schedule the same track twice.
+        """
+        with self._lock:
+            if track.checked_at is None:
+                due = True
+            elif track.identity is None or track.identity[0] is None:
+                due = now - track.checked_at >= self.unknown_retry
+            else:
+                due = now - track.checked_at >= self.reverify_interval
+            if due:
+                track.checked_at = now
+            return due
+
+    def _candidates(self, bboxes):
+        """(score, track index, detection index) pairs allowed to match, best first"""
+        if not self.tracks or not len(bboxes):
+            return []
+
+        old = np.array([t.bbox for t in self.tracks], dtype=np.float32)
+        new = np.asarray(bboxes, dtype=np.float32)
+
+        ix1 = np.maximum(old[:, None, 0], new[None, :, 0])
+        iy1 = np.maximum(old[:, None, 1], new[None, :, 1])
+        ix2 = np.minimum(old[:, None, 2], new[None, :, 2])
+        iy2 = np.minimum(old[:, None, 3], new[None, :, 3])
+        inter = np.clip(ix2 - ix1, 0, None) * np.clip(iy2 - iy1, 0, None)
+        old_area = (old[:, 2] - old[:, 0]) * (old[:, 3] - old[:, 1])
+        new_area = (new[:, 2] - new[:, 0]) * (new[:, 3] - new[:, 1])
+        iou = inter / np.maximum(old_area[:, None] + new_area[None, :] - inter, 1e-6)
+
+        old_centers = (old[:, :2] + old[:, 2:]) / 2
+        new_centers = (new[:, :2] + new[:, 2:]) / 2
+        dist = np.linalg.norm(old_centers[:, None, :] - new_centers[None, :, :], axis=2)
+        size = np.maximum(old[:, 2] - old[:, 0], old[:, 3] - old[:, 1])
+        near = dist <= self.centroid_factor * size[:, None]
+
+        # IoU matches rank first; centroid-only matches after, nearest first
+        score = np.where(iou >= self.iou_threshold, 1.0 + iou, np.where(near, 1.0 / (1.0 + dist / np.maximum(size[:, None], 1e-6)), 0.0))
+        pairs = np.argwhere(score > 0)
+        order = np.argsort(-score[pairs[:, 0], pairs[:, 1]], kind='stable')
+        return [(float(score[ti, di]), int(ti), int(di)) for ti, di in pairs[order]]
@@ -0,0 +1,41 @@
+import asyncio
+import httpx
+from core.attendance_sender import MAX_MARK_BATCH, AttendanceSender
+
+
+def deliver(handler, events, **kwargs):
+    async def run():
+        sender = AttendanceSender("http://backend", window=0, retries=0, **kwargs)
+        sender.start()
+        await sender.client.aclose()
+        sender.client = httpx.AsyncClient(base_url="http://backend", transport=httpx.MockTransport(handler))
+        try:
+            return await asyncio.gather(*(sender.send(event) for event in events))
+        finally:
+            await sender.close()
+
+    return asyncio.run(run())
+
+
+def test_refused_batch_is_left_for_a_retry():
+    results = deliver(lambda request: httpx.Response(413, text="Request Entity Too Large"),
+                      [{"idempotencyKey": "a"}, {"idempotencyKey": "b"}])
+
+    # No 4xx status per event, or the outbox would drop them as rejected
+    assert [result["success"] for result in results] == [False, False]
+    assert [result["httpStatus"] for result in results] == [None, None]
+
+
+def test_per_event_results_are_passed_through():
+    def handler(request):
+        return httpx.Response(200, json={"results": [{"success": True, "httpStatus": 200},
+                                                     {"success": False, "httpStatus": 409}]})
+
+    results = deliver(handler, [{"idempotencyKey": "a"}, {"idempotencyKey": "b"}])
+
+    assert [result["httpStatus"] for result in results] == [200, 409]
+
+
+def test_batch_size_is_capped_at_the_backend_limit():
+    assert AttendanceSender("http://backend", max_batch=500).max_batch == MAX_MARK_BATCH
+    assert AttendanceSender("http://backend", max_batch=20).max_batch == 20
@@ -0,0 +1,51 @@
+from types import SimpleNamespace
+import pytest
+
+onnxruntime = pytest.importorskip('onnxruntime')
+pytest.importorskip('insightface')
+from core import face_recognition
+
+
+class FakeSession:
+    """Stands in for onnxruntime.InferenceSession, which has no public model path"""
+
+    def __init__(self, path, sess_options=None, providers=None):
+        self._model_path = path
+        self.sess_options = sess_options
+        self.providers = providers or ['CPUExecutionProvider']
+
+    def get_providers(self):
+        return self.providers
+
+    def get_inputs(self):
+        return [SimpleNamespace(shape=['None', 3, 112, 112])]
+
+
+class FakeModel:
+    def __init__(self, model_file):
+        self.model_file = model_file
+        self.session = FakeSession(model_file)
+
+
+class FakeFaceAnalysis:
+    def __init__(self, name, providers, allowed_modules=None):
+        self.models = {
+            'detection': FakeModel('/models/det_10g.onnx'),
+            'recognition': FakeModel('/models/w600k_r50.onnx'),
+        }
+        self.det_model = self.models['detection']
+
+    def prepare(self, ctx_id, det_size):
+        pass
+
+
+def test_recognizer_with_thread_limit_rebuilds_sessions(monkeypatch):
+    monkeypatch.setattr(face_recognition, 'FaceAnalysis', FakeFaceAnalysis)
+    monkeypatch.setattr(onnxruntime, 'InferenceSession', FakeSession)
+
+    recognizer = face_recognition.FaceRecognizer(threads=1)
+
+    for model in recognizer.app.models.values():
+        assert model.session._model_path == model.model_file
+        assert model.session.sess_options.intra_op_num_threads == 1
+    assert recognizer.model_id == 'det_10g.onnx@640x640+w600k_r50.onnx'
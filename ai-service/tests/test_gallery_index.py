@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+from core.ann_index import BruteForceIndex, IVFIndex, create_index
+from core.gallery import EmbeddingGallery
+
+
+@pytest.mark.parametrize('kind', ['exact', 'ivf', 'hnsw'])
+def test_configured_index_survives_into_gallery(kind):
+    if kind == 'hnsw':
+        pytest.importorskip('hnswlib')
+    index = create_index(kind, dim=8)
+    assert len(index) == 0
+    assert EmbeddingGallery(dim=8, index=index).index is index
+
+
+def test_gallery_defaults_to_exact_search():
+    assert isinstance(EmbeddingGallery(dim=8).index, BruteForceIndex)
+
+
+def test_ivf_round_trip(tmp_path):
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((500, 8)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    index = IVFIndex(dim=8, nlist=16)
+    index.build(np.arange(500, dtype=np.int64), vectors)
+    index.save(str(tmp_path))
+
+    restored = IVFIndex(dim=8, nlist=16)
+    assert restored.load(str(tmp_path))
+    assert len(restored) == 500
+    ids, _ = restored.search(vectors[:5], 1)
+    assert ids[:, 0].tolist() == [0, 1, 2, 3, 4]
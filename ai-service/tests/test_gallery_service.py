@@ -0,0 +1,85 @@
+import asyncio
+import numpy as np
+import pytest
+
+aiomysql = pytest.importorskip('aiomysql')
+from core.embedding_codec import encode_embedding
+from core.gallery_service import GalleryService
+
+
+class FakeCursor:
+    def __init__(self, users):
+        self.users = users
+        self.rows = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, sql, params=()):
+        students = [user for user in self.users if user['face_embedding'] is not None]
+        if sql.startswith("SELECT COUNT(*)"):
+            self.rows = [(len(students),)]
+        elif sql.startswith("SELECT id FROM"):
+            self.rows = [(user['id'],) for user in students]
+        else:
+            ids = set(params)
+            self.rows = [{k: v for k, v in user.items() if k != 'role'} for user in students if user['id'] in ids]
+
+    async def fetchone(self):
+        return self.rows[0]
+
+    async def fetchall(self):
+        return self.rows
+
+
+class FakePool:
+    def __init__(self, users):
+        self.users = users
+
+    def acquire(self):
+        return self
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def cursor(self, cursor_class=None):
+        return FakeCursor(self.users)
+
+
+def user(sid, embedding=True):
+    vector = np.random.default_rng(sid).standard_normal(512).astype(np.float32)
+    return {'id': sid, 'student_id': f"S{sid}", 'first_name': 'A', 'last_name': 'B', 'role': 'student',
+            'face_embedding': encode_embedding(vector) if embedding else None}
+
+
+def test_reconcile_restores_students_removed_by_mistake():
+    users = [user(1), user(2), user(3)]
+    service = GalleryService(FakePool(users))
+    service.gallery.load(users)
+
+    # A /gallery/refresh ping dropped a student whose row is still live
+    service.request_refresh(removed_ids=[2])
+    assert set(service.gallery.students) == {1, 3}
+
+    asyncio.run(service._reconcile())
+
+    assert set(service.gallery.students) == {1, 2, 3}
+    assert len(service.gallery) == 3
+
+
+def test_reconcile_drops_deleted_students():
+    users = [user(1), user(2), user(3)]
+    service = GalleryService(FakePool(users))
+    service.gallery.load(users)
+    del users[2]
+
+    asyncio.run(service._reconcile())
+
+    assert set(service.gallery.students) == {1, 2}
+    assert len(service.gallery) == 2
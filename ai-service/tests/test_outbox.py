@@ -0,0 +1,42 @@
+import asyncio
+from core import outbox as outbox_module
+from core.outbox import AttendanceOutbox
+
+
+def test_same_second_events_drain_in_order_behind_a_deferred_one(tmp_path, monkeypatch):
+    # Every event is queued and drained within the same second
+    monkeypatch.setattr(outbox_module.time, 'time', lambda: 1_700_000_000.0)
+
+    async def run():
+        outbox = AttendanceOutbox(str(tmp_path / 'outbox.db'), base_backoff=0)
+        await outbox.open()
+        await outbox.add_event(1, 7, 'ENTRY')
+        await outbox.add_event(1, 8, 'ENTRY')
+        await outbox.add_event(1, 7, 'EXIT')
+        await outbox.add_event(1, 7, 'ENTRY')
+
+        sent = []
+        backend_up = False
+
+        async def send_events(payloads):
+            sent.append([(p['studentId'], p['direction']) for p in payloads])
+            # The first attempt fails for student 7; student 8 goes through
+            return [{'success': backend_up or p['studentId'] == 8, 'httpStatus': 200 if backend_up else 503}
+                    for p in payloads]
+
+        await outbox._drain_events(send_events)
+        backend_up = True
+        while await outbox._drain_events(send_events):
+            pass
+        await outbox.close()
+        return sent
+
+    sent = asyncio.run(run())
+
+    # Only the oldest pending event per student and session is ever in flight
+    assert sent == [
+        [(7, 'ENTRY'), (8, 'ENTRY')],
+        [(7, 'ENTRY')],
+        [(7, 'EXIT')],
+        [(7, 'ENTRY')],
+    ]
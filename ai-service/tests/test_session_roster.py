@@ -0,0 +1,33 @@
+from datetime import datetime
+import pytest
+
+pytest.importorskip('aiomysql')
+from core.session_roster import SessionRoster
+
+
+def session(id, class_id, hour, type='regular', batch_students=None):
+    return {'id': id, 'class_id': class_id, 'type': type, 'batch_students': batch_students,
+            'start_time': datetime(2026, 3, 2, hour)}
+
+
+def test_latest_started_session_wins_across_classes():
+    # Oldest first, as refresh() selects them
+    sessions = [session(1, 10, 8), session(2, 20, 10)]
+    # The older session's class comes last among the student's enrollments
+    enrollments = [{'class_id': 20, 'student_id': 7}, {'class_id': 10, 'student_id': 7},
+                   {'class_id': 10, 'student_id': 8}]
+
+    student_sessions = SessionRoster._build(sessions, enrollments)
+
+    assert student_sessions[7]['id'] == 2
+    assert student_sessions[8]['id'] == 1
+
+
+def test_batch_session_only_covers_its_students():
+    sessions = [session(1, 10, 8), session(2, 10, 9, type='batch', batch_students='[8]')]
+    enrollments = [{'class_id': 10, 'student_id': 7}, {'class_id': 10, 'student_id': 8}]
+
+    student_sessions = SessionRoster._build(sessions, enrollments)
+
+    assert student_sessions[7]['id'] == 1
+    assert student_sessions[8]['id'] == 2
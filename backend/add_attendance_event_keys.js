@@ -0,0 +1,34 @@
+const pool = require('./config/db');
+
+// Adds attendance_event_keys so marks replayed by the AI service outbox
+// (after a timeout or a backend outage) are applied only once.
+async function addAttendanceEventKeys() {
+    try {
+        console.log('Checking attendance_event_keys...');
+
+        const [tables] = await pool.query(`SHOW TABLES LIKE 'attendance_event_keys'`);
+        if (tables.length > 0) {
+            console.log('attendance_event_keys already exists.');
+        } else {
+            console.log('Creating attendance_event_keys...');
+            await pool.query(`
+                CREATE TABLE attendance_event_keys (
+                    idempotency_key VARCHAR(64) NOT NULL PRIMARY KEY,
+                    http_status SMALLINT NOT NULL,
+                    response TEXT NOT NULL,
+                    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                    INDEX idx_attendance_event_keys_created_at (created_at)
+                )
+            `);
+            console.log('Table created.');
+        }
+
+        console.log('Migration successful!');
+        process.exit(0);
+    } catch (err) {
+        console.error('Migration failed:', err);
+        process.exit(1);
+    }
+}
+
+addAttendanceEventKeys();
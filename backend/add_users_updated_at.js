@@ -0,0 +1,36 @@
+const pool = require('./config/db');
+
+// Adds users.updated_at so the AI service can pull only the face embeddings
+// that changed since its last refresh instead of re-reading every student.
+async function addUpdatedAt() {
+    try {
+        console.log('Checking users.updated_at...');
+
+        const [columns] = await pool.query(`SHOW COLUMNS FROM users LIKE 'updated_at'`);
+        if (columns.length > 0) {
+            console.log('users.updated_at already exists.');
+        } else {
+            console.log('Adding users.updated_at...');
+            await pool.query(`
+                ALTER TABLE users
+                ADD COLUMN updated_at TIMESTAMP NOT NULL
+                    DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+            `);
+            console.log('Column added.');
+        }
+
+        const [indexes] = await pool.query(`SHOW INDEX FROM users WHERE Key_name = 'idx_users_updated_at'`);
+        if (indexes.length === 0) {
+            console.log('Adding index on users.updated_at...');
+            await pool.query(`CREATE INDEX idx_users_updated_at ON users (updated_at)`);
+        }
+
+        console.log('Migration successful!');
+        process.exit(0);
+    } catch (err) {
+        console.error('Migration failed:', err);
+        process.exit(1);
+    }
+}
+
+addUpdatedAt();
@@ -0,0 +1,33 @@
+const pool = require('./config/db');
+
+// Switches users.face_embedding from JSON text to a binary column.
+// Existing JSON rows stay readable (the AI service reads both formats) and are
+// rewritten to packed float32 in the background by the AI service.
+async function convertFaceEmbeddingColumn() {
+    try {
+        console.log('Checking users.face_embedding column type...');
+
+        const [columns] = await pool.query(`SHOW COLUMNS FROM users LIKE 'face_embedding'`);
+        if (columns.length === 0) {
+            console.log('users.face_embedding not found, nothing to do.');
+            process.exit(0);
+        }
+
+        const type = columns[0].Type.toLowerCase();
+        if (type.includes('blob')) {
+            console.log(`users.face_embedding is already ${type}.`);
+        } else {
+            console.log(`Converting users.face_embedding from ${type} to MEDIUMBLOB...`);
+            await pool.query(`ALTER TABLE users MODIFY COLUMN face_embedding MEDIUMBLOB NULL`);
+            console.log('Column converted.');
+        }
+
+        console.log('Migration successful!');
+        process.exit(0);
+    } catch (err) {
+        console.error('Migration failed:', err);
+        process.exit(1);
+    }
+}
+
+convertFaceEmbeddingColumn();
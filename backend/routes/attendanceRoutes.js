@@ -1,5 +1,6 @@
 const express = require('express');
 const pool = require('../config/db');
+const { notifySessionsChanged } = require('../utils/aiServiceNotify');
 const router = express.Router();
 
 // ============================================
@@ -74,6 +75,9 @@ router.post('/sessions', async (req, res) => {
             ]
         );
 
+        // Let the AI service start recognizing this session's students now
+        notifySessionsChanged();
+
         res.status(201).json({
             success: true,
             message: `${sessionType.charAt(0).toUpperCase() + sessionType.slice(1)} session started`,
@@ -181,102 +185,115 @@ router.get('/sessions/:id/students', async (req, res) => {
 // ATTENDANCE MARKING
 // ============================================
 
-// Mark Attendance (called by AI Service or Manual)
-router.post('/mark', async (req, res) => {
-    const { sessionId, studentId, direction, snapshotUrl } = req.body;
-
+// Mark one attendance event. Returns { status, body } so single and batched
+// requests share the same rules.
+async function markAttendance({ sessionId, studentId, direction, snapshotUrl, occurredAt }) {
     if (!sessionId || !studentId) {
-        return res.status(400).json({ error: 'Missing sessionId or studentId' });
+        return { status: 400, body: { error: 'Missing sessionId or studentId' } };
     }
 
-    try {
-        // Get session details to check batch restrictions
-        const [sessions] = await pool.query('SELECT * FROM sessions WHERE id = ?', [sessionId]);
+    // Get session details to check batch restrictions
+    const [sessions] = await pool.query('SELECT * FROM sessions WHERE id = ?', [sessionId]);
 
-        if (sessions.length === 0) {
-            return res.status(404).json({ error: 'Session not found' });
-        }
+    if (sessions.length === 0) {
+        return { status: 404, body: { error: 'Session not found' } };
+    }
 
-        const session = sessions[0];
+    const session = sessions[0];
 
-        // Check if student is allowed in this session (batch restriction)
-        if (session.type === 'batch' && session.batch_students) {
-            const batchStudents = JSON.parse(session.batch_students);
-            if (!batchStudents.includes(studentId)) {
-                return res.status(403).json({
+    // Check if student is allowed in this session (batch restriction)
+    if (session.type === 'batch' && session.batch_students) {
+        const batchStudents = JSON.parse(session.batch_students);
+        if (!batchStudents.includes(studentId)) {
+            return {
+                status: 403,
+                body: {
                     error: 'Student not assigned to this batch session',
                     sessionType: 'batch'
-                });
-            }
+                }
+            };
         }
+    }
 
-        // Check if student is enrolled in the class
-        const [enrollment] = await pool.query(
-            'SELECT * FROM class_enrollments WHERE class_id = ? AND student_id = ?',
-            [session.class_id, studentId]
-        );
+    // Check if student is enrolled in the class
+    const [enrollment] = await pool.query(
+        'SELECT * FROM class_enrollments WHERE class_id = ? AND student_id = ?',
+        [session.class_id, studentId]
+    );
 
-        if (enrollment.length === 0) {
-            return res.status(403).json({ error: 'Student not enrolled in this class' });
-        }
+    if (enrollment.length === 0) {
+        return { status: 403, body: { error: 'Student not enrolled in this class' } };
+    }
 
-        // Find existing attendance log
-        const [existing] = await pool.query(
-            'SELECT * FROM attendance_logs WHERE session_id = ? AND student_id = ?',
-            [sessionId, studentId]
-        );
+    // Find existing attendance log
+    const [existing] = await pool.query(
+        'SELECT * FROM attendance_logs WHERE session_id = ? AND student_id = ?',
+        [sessionId, studentId]
+    );
 
-        const now = new Date();
+    // Events replayed from the AI service outbox carry the time they were seen
+    const eventTime = occurredAt ? new Date(occurredAt) : null;
+    const now = eventTime && !isNaN(eventTime.getTime()) ? eventTime : new Date();
 
-        // Handle EXIT
-        if (direction === 'EXIT') {
-            if (existing.length > 0) {
-                await pool.query(
-                    'UPDATE attendance_logs SET time_out = ? WHERE id = ?',
-                    [now, existing[0].id]
-                );
-                return res.json({
+    // Handle EXIT
+    if (direction === 'EXIT') {
+        if (existing.length > 0) {
+            await pool.query(
+                'UPDATE attendance_logs SET time_out = ? WHERE id = ?',
+                [now, existing[0].id]
+            );
+            return {
+                status: 200,
+                body: {
                     success: true,
                     message: 'Exit time recorded',
                     type: 'EXIT',
                     logId: existing[0].id
-                });
-            } else {
-                return res.status(400).json({
-                    error: 'Cannot mark exit without entry',
-                    hint: 'Student has not marked entry yet'
-                });
-            }
+                }
+            };
         }
+        return {
+            status: 400,
+            body: {
+                error: 'Cannot mark exit without entry',
+                hint: 'Student has not marked entry yet'
+            }
+        };
+    }
 
-        // Handle ENTRY (default)
-        if (existing.length > 0) {
-            return res.json({
+    // Handle ENTRY (default)
+    if (existing.length > 0) {
+        return {
+            status: 200,
+            body: {
                 success: true,
                 message: 'Already marked present',
                 status: existing[0].status,
                 timeIn: existing[0].time_in
-            });
-        }
+            }
+        };
+    }
 
-        // Determine status (Present vs Late)
-        let status = 'Present';
-        const sessionStart = new Date(`${session.date}T${session.start_time}`);
-        const diffMins = (now.getTime() - sessionStart.getTime()) / 60000;
+    // Determine status (Present vs Late)
+    let status = 'Present';
+    const sessionStart = new Date(`${session.date}T${session.start_time}`);
+    const diffMins = (now.getTime() - sessionStart.getTime()) / 60000;
 
-        if (diffMins > 15) {
-            status = 'Late';
-        }
-
-        // Insert attendance log
-        const [result] = await pool.query(
-            `INSERT INTO attendance_logs 
-            (session_id, student_id, time_in, status, snapshot_url) 
-            VALUES (?, ?, ?, ?, ?)`,
-            [sessionId, studentId, now, status, snapshotUrl || null]
-        );
+    if (diffMins > 15) {
+        status = 'Late';
+    }
 
-        res.status(201).json({
+    // Insert attendance log
+    const [result] = await pool.query(
+        `INSERT INTO attendance_logs 
+        (session_id, student_id, time_in, status, snapshot_url) 
+        VALUES (?, ?, ?, ?, ?)`,
+        [sessionId, studentId, now, status, snapshotUrl || null]
+    );
+
+    return {
+        status: 201,
+        body: {
             success: true,
             message: 'Attendance marked',
             type: 'ENTRY',
@@ -284,14 +301,105 @@ router.post('/mark', async (req, res) => {
             logId: result.insertId,
             timeIn: now,
             minutesLate: diffMins > 15 ? Math.floor(diffMins) : 0
-        });
+        }
+    };
+}
+
+// Mark an event at most once per idempotencyKey. The first result for a key
+// is stored and returned again for any replay of the same event.
+async function markAttendanceOnce(event) {
+    const { idempotencyKey } = event;
+    if (!idempotencyKey) {
+        return markAttendance(event);
+    }
 
+    try {
+        const [seen] = await pool.query(
+            'SELECT http_status, response FROM attendance_event_keys WHERE idempotency_key = ?',
+            [idempotencyKey]
+        );
+        if (seen.length > 0) {
+            return { status: seen[0].http_status, body: { ...JSON.parse(seen[0].response), replayed: true } };
+        }
+    } catch (err) {
+        // add_attendance_event_keys.js not run yet: mark without the guard
+        if (err.code === 'ER_NO_SUCH_TABLE') {
+            return markAttendance(event);
+        }
+        throw err;
+    }
+
+    const result = await markAttendance(event);
+    if (result.status < 500) {
+        await pool.query(
+            'INSERT IGNORE INTO attendance_event_keys (idempotency_key, http_status, response) VALUES (?, ?, ?)',
+            [idempotencyKey, result.status, JSON.stringify(result.body)]
+        );
+    }
+    return result;
+}
+
+// Idempotency keys only need to outlive the AI service outbox's retries of an
+// event (a backend outage at most, in practice); older ones are purged hourly.
+const EVENT_KEY_RETENTION_HOURS = parseFloat(process.env.ATTENDANCE_EVENT_KEY_RETENTION_HOURS || '168');
+
+async function purgeAttendanceEventKeys() {
+    try {
+        const [result] = await pool.query(
+            'DELETE FROM attendance_event_keys WHERE created_at < NOW() - INTERVAL ? SECOND',
+            [Math.round(EVENT_KEY_RETENTION_HOURS * 3600)]
+        );
+        if (result.affectedRows > 0) {
+            console.log(`Purged ${result.affectedRows} attendance event keys`);
+        }
+    } catch (err) {
+        if (err.code !== 'ER_NO_SUCH_TABLE') {
+            console.error('Attendance event key purge failed:', err.message);
+        }
+    }
+}
+
+setInterval(purgeAttendanceEventKeys, 60 * 60 * 1000).unref();
+
+// Mark Attendance (called by AI Service or Manual)
+router.post('/mark', async (req, res) => {
+    try {
+        const { status, body } = await markAttendanceOnce(req.body);
+        res.status(status).json(body);
     } catch (err) {
         console.error('Mark attendance error:', err);
         res.status(500).json({ error: 'Failed to mark attendance', details: err.message });
     }
 });
 
+const MAX_MARK_BATCH = 100;
+
+// Mark several attendance events in one request (AI Service micro-batches).
+// Events are applied in order; each result is the single-mark body plus its httpStatus.
+router.post('/mark/batch', async (req, res) => {
+    const { events } = req.body;
+
+    if (!Array.isArray(events) || events.length === 0) {
+        return res.status(400).json({ error: 'events must be a non-empty array' });
+    }
+    if (events.length > MAX_MARK_BATCH) {
+        return res.status(400).json({ error: `At most ${MAX_MARK_BATCH} events per batch` });
+    }
+
+    const results = [];
+    for (const event of events) {
+        try {
+            const { status, body } = await markAttendanceOnce(event || {});
+            results.push({ httpStatus: status, ...body });
+        } catch (err) {
+            console.error('Mark attendance error:', err);
+            results.push({ httpStatus: 500, error: 'Failed to mark attendance', details: err.message });
+        }
+    }
+
+    res.json({ results });
+});
+
 // Get Live Attendance for Session
 router.get('/session/:id/live', async (req, res) => {
     try {
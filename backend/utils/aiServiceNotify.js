@@ -0,0 +1,16 @@
+const axios = require('axios');
+
+const AI_SERVICE_URL = process.env.AI_SERVICE_URL || 'http://ai-service:8000';
+
+/**
+ * Tell the AI service that sessions started or ended so it rebuilds its
+ * student -> active session map right away instead of on its next poll.
+ * Fire-and-forget: the AI service still polls, so a failed call only
+ * delays recognition by one refresh interval.
+ */
+function notifySessionsChanged() {
+    axios.post(`${AI_SERVICE_URL}/sessions/refresh`, {}, { timeout: 2000 })
+        .catch(err => console.error('AI service session refresh failed:', err.message));
+}
+
+module.exports = { notifySessionsChanged };